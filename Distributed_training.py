@@ -0,0 +1,307 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import reverb
+import tensorflow as tf
+
+from tf_agents.experimental.distributed import reverb_variable_container
+from tf_agents.metrics import py_metrics
+from tf_agents.policies import py_tf_eager_policy
+from tf_agents.replay_buffers import reverb_replay_buffer
+from tf_agents.replay_buffers import reverb_utils
+from tf_agents.specs import tensor_spec
+from tf_agents.train import actor
+from tf_agents.train import learner
+from tf_agents.train import triggers
+from tf_agents.train.utils import strategy_utils
+
+from tensorflow.python.ops.numpy_ops import np_config
+np_config.enable_numpy_behavior()
+
+from Global_parameters import gp
+from Metrics_sink import get_sink, close_sinks
+from RL_agent import (REPLAY_TABLE, checkingdir, create_replay_table, create_reverb_checkpointer,
+                      create_fidelity_scheduler, create_sac_agent, create_scenario_scheduler,
+                      create_surrogate)
+from RL_environment import HandoverEnv
+from Stage_profiler import profiler, export_tensorboard
+from Training_checkpoint import TrainingCheckpointer
+
+# Training split over processes on one machine, talking to each other through
+# a Reverb server on localhost:
+#
+#   replay   the Reverb server: the replay table and a table holding the
+#            latest policy variables and train step of the learner
+#   actor    one HandoverEnv with its own simulator; acts with the collect
+#            policy, writes its trajectories through a
+#            ReverbAddTrajectoryObserver and pulls the policy variables every
+#            policy_pull_interval episodes
+#   learner  samples the replay table and trains, pushes the policy variables
+#            every policy_push_interval train steps, checkpoints and logs
+#   launch   starts the replay server, num_collect_workers actors and the
+#            learner, and stops the others when the learner is done
+#
+# The learner never steps an environment, so it trains while the simulators
+# run instead of waiting for them. Evaluation stays with main.py.
+
+def policy_variables(tf_agent, train_step):
+    return {
+        reverb_variable_container.POLICY_KEY: tf_agent.collect_policy.variables(),
+        reverb_variable_container.TRAIN_STEP_KEY: train_step,
+    }
+
+def create_variable_table(variables):
+    signature = tf.nest.map_structure(lambda variable: tf.TensorSpec(variable.shape, dtype=variable.dtype), variables)
+    return reverb.Table(
+        reverb_variable_container.DEFAULT_TABLE,
+        max_size=1,
+        max_times_sampled=0,
+        sampler=reverb.selectors.Uniform(),
+        remover=reverb.selectors.Fifo(),
+        rate_limiter=reverb.rate_limiters.MinSize(1),
+        signature=tensor_spec.add_outer_dim(signature))
+
+def create_agent(name):
+    # The agent of a process, built for the specs of a HandoverEnv; the
+    # environment is returned for the actors and closed by the others
+    env = HandoverEnv(name=name)
+    strategy = strategy_utils.get_strategy(tpu=False, use_gpu=False)
+    tf_agent, _, _, train_step = create_sac_agent(strategy, env)
+    return env, strategy, tf_agent, train_step
+
+def wait_for_server(address, timeout=60):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            reverb.Client(address).server_info(timeout=5)
+            return
+        except Exception:
+            if time.time() > deadline:
+                raise
+            time.sleep(1)
+
+def run_replay(port):
+    env, _, tf_agent, train_step = create_agent('replay')
+    env.close()
+    server = reverb.Server(
+        [create_replay_table(gp.samples_per_insert), create_variable_table(policy_variables(tf_agent, train_step))],
+        port=port, checkpointer=create_reverb_checkpointer())
+    print('Replay server on port', server.port)
+    server.wait()
+
+def run_learner(address):
+    env, strategy, tf_agent, train_step = create_agent('learner')
+    env.close()
+    reverb_replay = reverb_replay_buffer.ReverbReplayBuffer(
+        tf_agent.collect_data_spec,
+        sequence_length=2,
+        table_name=REPLAY_TABLE,
+        server_address=address)
+    dataset = reverb_replay.as_dataset(
+        sample_batch_size=gp.batch_size, num_steps=2, num_parallel_calls=5).prefetch(50)
+
+    # Only the learner checkpoints; the actors start new scenarios when resumed
+    checkpointer = TrainingCheckpointer(
+        gp.checkpoint_dir, tf_agent, train_step, reverb.Client(address), [],
+        max_to_keep=gp.checkpoints_to_keep, async_checkpoint=gp.async_checkpoint)
+    if gp.resume_training:
+        checkpointer.restore()
+
+    variables = policy_variables(tf_agent, train_step)
+    variable_container = reverb_variable_container.ReverbVariableContainer(
+        address, table_names=[reverb_variable_container.DEFAULT_TABLE])
+    variable_container.push(variables)
+
+    agent_learner = learner.Learner(
+        checkingdir,
+        train_step,
+        tf_agent,
+        lambda: dataset,
+        triggers=[
+            triggers.PolicySavedModelTrigger(
+                os.path.join(checkingdir, learner.POLICY_SAVED_MODEL_DIR),
+                tf_agent,
+                train_step,
+                interval=gp.policy_save_interval),
+            triggers.StepPerSecondLogTrigger(train_step, interval=1000),
+        ],
+        strategy=strategy)
+
+    log_sink = get_sink(gp.file_name, gp.metrics_flush_interval)
+    if profiler.enabled:
+        stats_sink = get_sink(gp.profile_stats_file, 1)
+        stats_writer = tf.summary.create_file_writer(os.path.join(checkingdir, 'stages'))
+    log_time = time.perf_counter()
+    log_step = agent_learner.train_step_numpy
+    while agent_learner.train_step_numpy < gp.num_iterations:
+        with profiler.stage('learner'):
+            loss_info = agent_learner.run(iterations=1)
+        step = agent_learner.train_step_numpy
+
+        if step % gp.policy_push_interval == 0:
+            with profiler.stage('policy_push'):
+                variable_container.push(variables)
+
+        if profiler.enabled and step % gp.profile_report_interval == 0:
+            stage_stats = profiler.report()
+            stats_sink.write(dict(step=step, **stage_stats))
+            export_tensorboard(stage_stats, step, stats_writer)
+
+        if gp.checkpoint_interval and step % gp.checkpoint_interval == 0:
+            with profiler.stage('checkpoint'):
+                checkpointer.save(step)
+
+        if gp.log_interval and step % gp.log_interval == 0:
+            now = time.perf_counter()
+            steps_per_sec = (step - log_step) / (now - log_time)
+            log_time, log_step = now, step
+            print('step = {0}: loss = {1}: steps/s = {2:.3f}'.format(step, loss_info.loss.numpy(), steps_per_sec))
+            log_sink.write({'record': 'train', 'step': step, 'steps_per_sec': steps_per_sec,
+                            'loss': loss_info.loss.numpy()})
+
+    # The last push tells the actors training is over
+    variable_container.push(variables)
+    if gp.checkpoint_interval:
+        checkpointer.save(agent_learner.train_step_numpy, wait=True)
+    checkpointer.close()
+    close_sinks()
+
+def run_actor(address, actor_id, stop_grace=5):
+    env, _, tf_agent, train_step = create_agent('actor_{}'.format(actor_id))
+    if gp.use_surrogate:
+        env.surrogate = create_surrogate()
+    # Every actor follows the schedule on the train step it last pulled
+    if gp.fidelity_schedule is not None:
+        env.fidelity = create_fidelity_scheduler()
+    # Every actor draws from the same pool
+    env.scenarios = create_scenario_scheduler()
+    variables = policy_variables(tf_agent, train_step)
+    variable_container = reverb_variable_container.ReverbVariableContainer(
+        address, table_names=[reverb_variable_container.DEFAULT_TABLE])
+    # Waits for the first push of the learner
+    variable_container.update(variables)
+
+    collect_policy = py_tf_eager_policy.PyTFEagerPolicy(tf_agent.collect_policy, use_tf_function=True)
+    observer = reverb_utils.ReverbAddTrajectoryObserver(
+        reverb.Client(address),
+        REPLAY_TABLE,
+        sequence_length=2,
+        stride_length=1)
+    collector = actor.Actor(
+        env,
+        collect_policy,
+        train_step,
+        steps_per_run=1,
+        metrics=actor.collect_metrics(10),
+        summary_dir=os.path.join(checkingdir, learner.TRAIN_DIR, 'actor_{}'.format(actor_id)),
+        observers=[observer, py_metrics.EnvironmentSteps()])
+
+    # A SIGTERM from launch stops the actor after its current episode, like
+    # the end of training does, so its last trajectories and archived
+    # episodes are still written. The episodes run on a thread of their own:
+    # an insert the rate limiter of the replay table holds up, e.g. once the
+    # learner stopped sampling, blocks that thread, never the main thread
+    # that handles the signal and cleans up
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    errors = []
+
+    def collect():
+        try:
+            episodes = 0
+            while not stop_event.is_set() and train_step.numpy() < gp.num_iterations:
+                if env.fidelity is not None:
+                    env.fidelity.advance(train_step.numpy())
+                with profiler.stage('collect'):
+                    collector.run()
+                episodes += 1
+                if episodes % gp.policy_pull_interval == 0:
+                    with profiler.stage('policy_pull'):
+                        variable_container.update(variables)
+        except BaseException as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=collect, name='collect', daemon=True)
+    thread.start()
+    while thread.is_alive() and not stop_event.is_set():
+        thread.join(1.0)
+    thread.join(stop_grace)
+    if thread.is_alive():
+        # Still held up by the rate limiter: what it would write is lost
+        # with the table, so the actor leaves without it
+        print('Actor', actor_id, 'stopped while blocked on the replay table')
+        env.close()
+        close_sinks()
+        os._exit(0)
+    observer.close()
+    env.close()
+    if errors:
+        raise errors[0]
+
+def stop(processes, timeout, kill_timeout=10):
+    # Waits up to timeout seconds for the processes to exit, then terminates
+    # the others, and kills what is left kill_timeout seconds later
+    deadline = time.time() + timeout
+    for process in processes:
+        try:
+            process.wait(timeout=max(0, deadline - time.time()))
+        except subprocess.TimeoutExpired:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=kill_timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+def launch(port):
+    script = os.path.abspath(__file__)
+    address = 'localhost:{}'.format(port)
+
+    def start(*args):
+        return subprocess.Popen([sys.executable, script] + list(args) + ['--port', str(port)])
+
+    replay_process = start('replay')
+    learner_process = None
+    actor_processes = []
+    try:
+        wait_for_server(address)
+        learner_process = start('learner')
+        actor_processes = [start('actor', '--actor_id', str(actor_id)) for actor_id in range(gp.num_collect_workers)]
+        return learner_process.wait()
+    finally:
+        # The actors stop by themselves once they pull the last policy of
+        # the learner and finish their episode; the replay server stays up
+        # until they have written their trajectories
+        stop(actor_processes, gp.actor_stop_timeout)
+        if learner_process is not None:
+            stop([learner_process], 0)
+        stop([replay_process], 0)
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Train with separate replay, actor and learner processes')
+    arg_parser.add_argument('role', choices=['launch', 'replay', 'actor', 'learner'])
+    arg_parser.add_argument('--port', type=int, default=gp.reverb_port, help='Port of the Reverb server on localhost')
+    arg_parser.add_argument('--actor_id', type=int, default=0, help='Number of the actor, names its environment')
+    args = arg_parser.parse_args()
+
+    address = 'localhost:{}'.format(args.port)
+    if args.role == 'launch':
+        sys.exit(launch(args.port))
+    elif args.role == 'replay':
+        run_replay(args.port)
+    elif args.role == 'learner':
+        wait_for_server(address)
+        run_learner(address)
+    else:
+        wait_for_server(address)
+        run_actor(address, args.actor_id)
@@ -1,277 +1,334 @@
-from __future__ import absolute_import
-from __future__ import division
-from __future__ import print_function
-
-import subprocess
-import re
-import datatracker
-import math
-import numpy as np
-
-from tf_agents.environments import py_environment
-from tf_agents.trajectories import time_step as ts
-from tensorflow.python.ops.numpy_ops import np_config
-
-from Global_parameters import gp
-
-np_config.enable_numpy_behavior()
-
-
-class Environment_parser:
-    def __init__(self) -> None:
-        pass
-
-    def parse_document(self, data, file_name):
-        UE = 'ue'
-        CELL = 'cell'
-        f = open(file_name, "r")
-        for line in f:
-            match = re.match(r'^(.*) ms: Cell state: Cell (.*) at (.*) (.*) direction (.*)$', line)
-            if match:
-                data.add_data(int(match.group(1)), CELL, int(match.group(2)),
-                    coords=(float(match.group(3)), float(match.group(4))),
-                    direction=int(match.group(5)))
-                # print("cords, direction", (float(match.group(3)), float(match.group(4))), int(match.group(5)))
-            match = re.match(r'^(.*) ms: UE state: IMSI (.*) at (.*) (.*) with (.*) received bytes$', line)
-            if match:
-                data.add_data(int(match.group(1)), UE, int(match.group(2)),
-                    coords=(float(match.group(3)), float(match.group(4))),
-                    bytes_rx=int(match.group(5)))
-            match = re.match(r'^(.*) ms: UE seen at cell: Cell (.*) saw IMSI (.*) \(context: .*\)$', line)
-            if match:
-                data.add_data(int(match.group(1)), UE, int(match.group(3)),
-                    cell_associated=int(match.group(2)))
-            match = re.match(r'^(.*) ms: Measurement report: Cell .* got measurements from IMSI (.*) \(ID .*, cell:RSRP/RSRQ (.*)\)$', line)
-            if match:
-                timestep, imsi = int(match.group(1)), int(match.group(2))
-                measurements = match.group(3).split(' ')
-                for measurement in measurements:
-                    match = re.match(r'^(.*):(.*)/(.*)$', measurement)
-                    cell, rsrp, rsrq = int(match.group(1)), int(match.group(2)), int(match.group(3))
-                    # print("cell, rsrp, rsrq", cell, rsrp, rsrq)
-                    data.add_data(timestep, UE, imsi, **{
-                        'rsrp_for_%d' % cell: rsrp,
-                        'rsrq_for_%d' % cell: rsrq,
-                    })
-                            
-    def find_cell_ue_dicts(self, data, durration_in_ms):
-        ue_cell_connection = {}
-        cell_connected_ue = {}
-        for ue in data['ue']:
-            ue_cell_connection[ue] = {}
-            # print('ue: ', ue, 'cells: ', data['ue'][ue]['cell_associated'])
-            for index, (time, cell) in enumerate(data['ue'][ue]['cell_associated']):
-                if cell not in ue_cell_connection[ue].keys():
-                    ue_cell_connection[ue][cell] = []
-                # else:
-                    # print('cell ' + str(cell) + ' in ue ' + str(ue) + ' is repeated!')
-                ue_cell_connection[ue][cell].append([round(time, -2), durration_in_ms-1])
-                if cell not in cell_connected_ue.keys():
-                    cell_connected_ue[cell] = {}
-                cell_connected_ue[cell][ue] = ue_cell_connection[ue][cell]
-                if index > 0:
-                    ue_cell_connection[ue][data['ue'][ue]['cell_associated'][index-1][1]][-1][1] = round(time, -2)
-                    cell_connected_ue[data['ue'][ue]['cell_associated'][index-1][1]][ue] = ue_cell_connection[ue][data['ue'][ue]['cell_associated'][index-1][1]]
-
-
-        return ue_cell_connection, cell_connected_ue
-
-    def Add_more_cell_info(self, data, cell_connected_ue):
-        cell_info = {}
-        all_cells = list(range(1, gp.ENB_Count+1))
-        for index, (cell, ue_info) in enumerate(cell_connected_ue.items()):
-            # print(index, cell, ue_info)
-            all_cells.remove(int(cell))
-            all_ues_durations = []
-            all_ues_distances = []
-            all_ues_throughputs = []
-            all_ues_rsrq = []
-            all_ues_rsrp = []
-            handovers = 0
-            for ue, time_intevals in ue_info.items():
-                # print('ue', ue, ' in cell', cell)
-                throughputs = []
-                rsrqs = []
-                rsrps = []
-                distances = []
-                duration_ue = 0
-                for time_inteval in time_intevals:
-                    handovers += 1
-
-                    duration_ue += time_inteval[1]-time_inteval[0]
-
-                    if 'rsrq_for_'+str(cell) not in data['ue'][ue].keys():
-                        rsrq = [(0,0)]
-                    else: 
-                        rsrq = list(filter(lambda x: (x[0] >= time_inteval[0] and x[0] <= time_inteval[1]), data['ue'][ue]['rsrq_for_'+str(cell)]))
-                    rsrqs.extend([row[1] for row in rsrq])
-                    all_ues_rsrq.extend([row[1] for row in rsrq])
-
-                    if 'rsrp_for_'+str(cell) not in data['ue'][ue].keys():
-                        rsrp = [(0,0)]
-                    else: 
-                        rsrp = list(filter(lambda x: (x[0] >= time_inteval[0] and x[0] <= time_inteval[1]), data['ue'][ue]['rsrp_for_'+str(cell)]))
-                    rsrps.extend([row[1] for row in rsrp])
-                    all_ues_rsrp.extend([row[1] for row in rsrp])
-
-                    throughput = list(filter(lambda x: (x[0] >= time_inteval[0] and x[0] <= time_inteval[1]), data['ue'][ue]['bytes_rx']))
-                    throughput_values = [row[1] for row in throughput]
-                    throughput_times = [row[0] for row in throughput]
-
-
-                    for time_step in range(time_inteval[0], time_inteval[1]+1, 100):
-                        coords = list(filter(lambda x: (x[0] == time_step), data['ue'][ue]['coords']))
-                        # print('time_step:', time_step, 'coords: ', coords)
-                        if len(coords) > 0:
-                            coords = coords[0]
-                            distance = math.sqrt((coords[1][0]- data['cell'][cell]['coords'][0][1][0])**2 +
-                                            (coords[1][1] - data['cell'][cell]['coords'][0][1][1])**2)
-                            distances.append(distance)
-                        all_ues_distances.append(distance)
-
-                        if round(time_step, -2) in throughput_times:
-                            throughputs_index = throughput_times.index(round(time_step, -2))
-                            throughputs.append(throughput_values[throughputs_index])
-                            all_ues_throughputs.append(throughput_values[throughputs_index])
-
-
-                all_ues_durations.append(duration_ue)
-                info_dict = {}
-                info_dict['distances'] = np.array(distances)
-                info_dict['rsrq'] = np.array(rsrqs)
-                info_dict['rsrp'] = np.array(rsrps)
-                info_dict['throughputs'] = np.array(throughputs)
-                cell_connected_ue[cell][ue].append(info_dict)
-                myoutput = open(gp.rsrq_throughput_file, 'a')
-                if not (len(info_dict['rsrp']) == 0 or len(info_dict['rsrp']) == 0 or len(info_dict['rsrp']) == 0):
-                    subprocess.run(["echo", 'cell = {0}: ue = {1}: avg_throughput = {2}: avg_rsrq  = {3}: avg_rsrp  = {4}\n'.format(cell, ue, sum(info_dict['throughputs'])/len(info_dict['throughputs']), sum(info_dict['rsrq'])/len(info_dict['rsrq']), sum(info_dict['rsrp'])/len(info_dict['rsrp']))], stdout=myoutput)
-
-            # print('duration', all_ues_durations)
-            all_ues_durations = np.array(all_ues_durations)
-            all_ues_distances = np.array(all_ues_distances)
-            all_ues_throughputs = np.array(all_ues_throughputs)
-            # print('cell', cell, 'rsrq', all_ues_rsrq)
-            all_ues_rsrq = np.array(all_ues_rsrq)
-            all_ues_rsrp = np.array(all_ues_rsrp)
-            
-            cell_info[cell] = {'durations': all_ues_durations, 'distances': all_ues_distances, 'rsrqs': all_ues_rsrq, 'rsrps': all_ues_rsrp, 
-                            'throughputs': all_ues_throughputs, 'handovers':  np.array([handovers])[0],
-                            'ue_connected': np.array([len(cell_connected_ue[cell].keys())])[0]}
-            
-        for cell in all_cells:
-            cell_info[cell] = {'durations': [0], 'distances': [0], 'rsrqs': [0], 'rsrps': [0], 
-                            'throughputs': [0], 'handovers': 0, 'ue_connected': 0}
-            
-        # print(cell_info)
-        subprocess.run(["echo", '\n'], stdout=myoutput)
-        return cell_connected_ue, cell_info
-
-    def find_max(self, cell_info, key, eval1, eval2):
-        max_arr = []
-        for cell, value in cell_info.items():
-            if len(value[key]) == 0:
-                max_arr.append(0)
-            else: max_arr.append(max(value[key]))
-        return max(max_arr)
-
-    def find_state(self, cell_info, ue_cell_connection, UE_Count, duration, eval1, eval2, max_speed, min_speed):
-        state = []
-        if eval1:
-            gp.eval_handovers_count = 0
-        elif eval2:
-            gp.eval2_handovers_count = 0
-        else:
-            gp.handovers_count = 0
-        for cell, info in cell_info.items():
-            cell_state = np.zeros([gp.all_count])
-            for key, value in info.items():
-                if key == 'durations' or key == 'distances' or key == 'rsrqs' or key == 'throughputs' or key == 'rsrps':
-                    max_value = self.find_max(cell_info, key, eval1, eval2)
-                    # print(max_value, key)
-                    if len(value) == 0:
-                        avg = 0
-                        min_value = 0
-                        max_value = 0
-                    else:
-                        values = value/max_value
-                        avg = sum(values) / len(values)
-                        min_value = min(values)
-                        max_value = max(values)
-                    if key == 'durations':
-                        cell_state[0] = avg
-                        cell_state[1] = min_value
-                        cell_state[2] = max_value
-                    elif key == 'distances':
-                        cell_state[3] = avg
-                        cell_state[4] = min_value
-                        cell_state[5] = max_value
-                    elif key == 'rsrqs':
-                        cell_state[6] = avg
-                        if eval1:
-                            gp.eval_cell_rsrqs.append(max_value)
-                        elif eval2:
-                            gp.eval2_cell_rsrqs.append(max_value)
-                        else:
-                            gp.cell_rsrqs.append(max_value)
-                    elif key == 'rsrps':
-                        cell_state[7] = avg
-                    elif key == 'throughputs':
-                        cell_state[8] = avg
-                        if eval1:
-                            gp.eval_cell_throughputs.append(max_value)
-                        elif eval2:
-                            gp.eval2_cell_throughputs.append(max_value)
-                        else:
-                            gp.cell_throughputs.append(max_value)
-                if key == 'handovers':
-                    cell_state[9] = value/100
-                    if eval1:
-                        gp.eval_handovers_count += value
-                    elif eval2:
-                        gp.eval2_handovers_count += value
-                    else:
-                        gp.handovers_count += value
-                if key == 'ue_connected':
-                    cell_state[10] = value/10
-            state.extend(cell_state)
-        print('handovers', gp.handovers_count)
-        state.append(UE_Count/gp.UE_upper_count)
-        state.append(max_speed)
-        state.append(min_speed)
-        state.append(duration)
-        return state
-
-    def find_reward(self, data, cell_connected_ue, duration, UE_Count, eval1, eval2): #total time in 100 ms
-        HO_total = 0
-        throughput_total = 0
-        count = 0
-        rsrq_sum = 0
-
-        for cell in data.data['cell'].keys():
-            throughput_sum = 0
-            if(cell in cell_connected_ue.keys()):
-                for ue, info in cell_connected_ue[cell].items():
-                    throughput_sum += sum(info[-1]['throughputs'])
-                    rsrq_sum += sum(info[-1]['rsrq'])
-                    count += 1
-                    HO_total += len(info) - 1
-                cell_throughput = throughput_sum / (duration * 10)
-                throughput_total += cell_throughput
-
-        # print('handovers from reward', HO_total)
-        ANOH = HO_total / (UE_Count * duration * 10)
-        optimize_ratio = throughput_total / ANOH
-        rsrq_avg = rsrq_sum / count
-
-        if eval1:
-            gp.eval_throughput_to_save.append(throughput_total)
-            gp.eval_rsrq_to_save.append(rsrq_sum)
-        elif eval2:
-            gp.eval2_throughput_to_save.append(throughput_total)
-            gp.eval2_rsrq_to_save.append(rsrq_sum)
-        else:
-            gp.throughput_to_save.append(throughput_total)
-            gp.rsrq_to_save.append(rsrq_sum)
-
-        rsrq = rsrq_sum / duration * 10
-        return throughput_total / 50000
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import re
+import datatracker
+import numpy as np
+
+from Global_parameters import gp
+from Metrics_sink import get_sink
+
+
+def find_first(times, time_steps):
+    # For each wanted time step, whether the sorted times contain it and the
+    # index of its first occurrence
+    index = np.searchsorted(times, time_steps, side='left')
+    found = index < len(times)
+    found[found] = times[index[found]] == time_steps[found]
+    return found, index
+
+def join_values(pieces):
+    # Concatenates per interval arrays into the array np.array() would have
+    # built from the equivalent list of Python numbers
+    pieces = [piece for piece in pieces if len(piece) > 0]
+    if len(pieces) == 0:
+        return np.array([])
+    values = np.concatenate(pieces)
+    return values.astype(np.int64 if values.dtype.kind in 'iub' else np.float64)
+
+
+class Environment_parser:
+    def __init__(self) -> None:
+        pass
+
+    def parse_document(self, data, file_name):
+        with open(file_name, "r") as f:
+            self.parse_lines(data, f)
+
+    def parse_lines(self, data, lines):
+        # lines can be any iterable of trace lines, e.g. an open trace file or
+        # the stdout pipe of a running simulator. The record type is picked
+        # from the literal text after '<time> ms: ' and the fields are taken
+        # by position from the space separated words, in the same order as
+        # simulator.cc prints them. The resulting data is identical to
+        # parse_lines_legacy
+        UE = 'ue'
+        CELL = 'cell'
+        append = data.append
+        measurement_keys = {}
+        for line in lines:
+            time, sep, record = line.partition(' ms: ')
+            if not sep:
+                continue
+            kind = record[:4]
+            if kind == 'UE s':
+                if record.startswith('UE state: IMSI '):
+                    # UE state: IMSI <imsi> at <x> <y> with <bytes> received bytes
+                    words = record.split(' ', 9)
+                    timestep, imsi = int(time), int(words[3])
+                    append(timestep, UE, imsi, 'coords', (float(words[5]), float(words[6])))
+                    append(timestep, UE, imsi, 'bytes_rx', int(words[8]))
+                elif record.startswith('UE seen at cell: Cell '):
+                    # UE seen at cell: Cell <cell> saw IMSI <imsi> (context: <context>)
+                    words = record.split(' ', 9)
+                    append(int(time), UE, int(words[8]), 'cell_associated', int(words[5]))
+            elif kind == 'Meas':
+                # Measurement report: Cell <cell> got measurements from IMSI <imsi>
+                # (ID <id>, cell:RSRP/RSRQ <cell>:<rsrp>/<rsrq> ...)
+                header, sep, measurements = record.rstrip('\r\n').partition(', cell:RSRP/RSRQ ')
+                if not sep or not header.startswith('Measurement report: Cell '):
+                    continue
+                timestep, imsi = int(time), int(header.split(' ', 9)[8])
+                for measurement in measurements[:-1].split(' '):
+                    cell, sep, values = measurement.partition(':')
+                    rsrp, sep, rsrq = values.partition('/')
+                    keys = measurement_keys.get(cell)
+                    if keys is None:
+                        keys = measurement_keys[cell] = ('rsrp_for_%d' % int(cell), 'rsrq_for_%d' % int(cell))
+                    append(timestep, UE, imsi, keys[0], int(rsrp))
+                    append(timestep, UE, imsi, keys[1], int(rsrq))
+            elif kind == 'Cell':
+                if record.startswith('Cell state: Cell '):
+                    # Cell state: Cell <cell> at <x> <y> direction <direction>
+                    words = record.split()
+                    timestep, cell = int(time), int(words[3])
+                    append(timestep, CELL, cell, 'coords', (float(words[5]), float(words[6])))
+                    append(timestep, CELL, cell, 'direction', int(words[8]))
+
+    def parse_lines_legacy(self, data, lines):
+        # Original regex based parser, kept as the reference for parse_lines
+        UE = 'ue'
+        CELL = 'cell'
+        for line in lines:
+            match = re.match(r'^(.*) ms: Cell state: Cell (.*) at (.*) (.*) direction (.*)$', line)
+            if match:
+                data.add_data(int(match.group(1)), CELL, int(match.group(2)),
+                    coords=(float(match.group(3)), float(match.group(4))),
+                    direction=int(match.group(5)))
+                # print("cords, direction", (float(match.group(3)), float(match.group(4))), int(match.group(5)))
+            match = re.match(r'^(.*) ms: UE state: IMSI (.*) at (.*) (.*) with (.*) received bytes$', line)
+            if match:
+                data.add_data(int(match.group(1)), UE, int(match.group(2)),
+                    coords=(float(match.group(3)), float(match.group(4))),
+                    bytes_rx=int(match.group(5)))
+            match = re.match(r'^(.*) ms: UE seen at cell: Cell (.*) saw IMSI (.*) \(context: .*\)$', line)
+            if match:
+                data.add_data(int(match.group(1)), UE, int(match.group(3)),
+                    cell_associated=int(match.group(2)))
+            match = re.match(r'^(.*) ms: Measurement report: Cell .* got measurements from IMSI (.*) \(ID .*, cell:RSRP/RSRQ (.*)\)$', line)
+            if match:
+                timestep, imsi = int(match.group(1)), int(match.group(2))
+                measurements = match.group(3).split(' ')
+                for measurement in measurements:
+                    match = re.match(r'^(.*):(.*)/(.*)$', measurement)
+                    cell, rsrp, rsrq = int(match.group(1)), int(match.group(2)), int(match.group(3))
+                    # print("cell, rsrp, rsrq", cell, rsrp, rsrq)
+                    data.add_data(timestep, UE, imsi, **{
+                        'rsrp_for_%d' % cell: rsrp,
+                        'rsrq_for_%d' % cell: rsrq,
+                    })
+                            
+    def find_cell_ue_dicts(self, data, durration_in_ms):
+        ue_cell_connection = {}
+        cell_connected_ue = {}
+        for ue in data['ue']:
+            ue_cell_connection[ue] = {}
+            # print('ue: ', ue, 'cells: ', data['ue'][ue]['cell_associated'])
+            for index, (time, cell) in enumerate(data['ue'][ue]['cell_associated']):
+                if cell not in ue_cell_connection[ue].keys():
+                    ue_cell_connection[ue][cell] = []
+                # else:
+                    # print('cell ' + str(cell) + ' in ue ' + str(ue) + ' is repeated!')
+                ue_cell_connection[ue][cell].append([round(time, -2), durration_in_ms-1])
+                if cell not in cell_connected_ue.keys():
+                    cell_connected_ue[cell] = {}
+                cell_connected_ue[cell][ue] = ue_cell_connection[ue][cell]
+                if index > 0:
+                    ue_cell_connection[ue][data['ue'][ue]['cell_associated'][index-1][1]][-1][1] = round(time, -2)
+                    cell_connected_ue[data['ue'][ue]['cell_associated'][index-1][1]][ue] = ue_cell_connection[ue][data['ue'][ue]['cell_associated'][index-1][1]]
+
+
+        return ue_cell_connection, cell_connected_ue
+
+    def Add_more_cell_info(self, data, cell_connected_ue):
+        # Every connection interval is cut out of the UE's time series with a
+        # binary search on the timestamps and its samples are reduced with
+        # array operations, instead of filtering the whole series in Python
+        # for every interval and every 100 ms step
+        cell_info = {}
+        quality_sink = get_sink(gp.rsrq_throughput_file, gp.metrics_flush_interval)
+        all_cells = list(range(1, gp.ENB_Count+1))
+        # Distance of the last step that had coordinates; a step without
+        # coordinates repeats it, like the per-step loop this replaces did
+        distance = np.nan
+        for index, (cell, ue_info) in enumerate(cell_connected_ue.items()):
+            # print(index, cell, ue_info)
+            all_cells.remove(int(cell))
+            cell_coords = data['cell'][cell]['coords'].values[0]
+            all_ues_durations = []
+            all_ues_distances = []
+            all_ues_throughputs = []
+            all_ues_rsrq = []
+            all_ues_rsrp = []
+            handovers = 0
+            for ue, time_intevals in ue_info.items():
+                # print('ue', ue, ' in cell', cell)
+                ue_data = data['ue'][ue]
+                rsrq_series = ue_data.get('rsrq_for_'+str(cell))
+                rsrp_series = ue_data.get('rsrp_for_'+str(cell))
+                coord_times, coord_values = ue_data['coords'].times, ue_data['coords'].values
+                throughput_times, throughput_values = ue_data['bytes_rx'].times, ue_data['bytes_rx'].values
+                throughputs = []
+                rsrqs = []
+                rsrps = []
+                distances = []
+                duration_ue = 0
+                for time_inteval in time_intevals:
+                    handovers += 1
+
+                    duration_ue += time_inteval[1]-time_inteval[0]
+
+                    if rsrq_series is None:
+                        rsrq = np.zeros(1, dtype=np.int64)
+                    else:
+                        rsrq = rsrq_series.between(time_inteval[0], time_inteval[1])[1]
+                    rsrqs.append(rsrq)
+                    all_ues_rsrq.append(rsrq)
+
+                    if rsrp_series is None:
+                        rsrp = np.zeros(1, dtype=np.int64)
+                    else:
+                        rsrp = rsrp_series.between(time_inteval[0], time_inteval[1])[1]
+                    rsrps.append(rsrp)
+                    all_ues_rsrp.append(rsrp)
+
+                    # Interval starts are rounded to 100 ms, so the steps line
+                    # up with the 100 ms UE state samples
+                    time_steps = np.arange(time_inteval[0], time_inteval[1]+1, 100)
+                    if len(time_steps) == 0:
+                        continue
+
+                    coords_found, coords_index = find_first(coord_times, time_steps)
+                    step_coords = coord_values[coords_index[coords_found]]
+                    found_distances = np.sqrt((step_coords[:, 0] - cell_coords[0])**2 +
+                                              (step_coords[:, 1] - cell_coords[1])**2)
+                    distances.append(found_distances)
+                    # Steps without coordinates take the distance of the last step that had them
+                    step_distances = np.append(found_distances, distance)[np.cumsum(coords_found) - 1]
+                    all_ues_distances.append(step_distances)
+                    distance = step_distances[-1]
+
+                    throughput_found, throughput_index = find_first(throughput_times, time_steps)
+                    throughput = throughput_values[throughput_index[throughput_found]]
+                    throughputs.append(throughput)
+                    all_ues_throughputs.append(throughput)
+
+                all_ues_durations.append(duration_ue)
+                info_dict = {}
+                info_dict['distances'] = join_values(distances)
+                info_dict['rsrq'] = join_values(rsrqs)
+                info_dict['rsrp'] = join_values(rsrps)
+                info_dict['throughputs'] = join_values(throughputs)
+                cell_connected_ue[cell][ue].append(info_dict)
+                if not (len(info_dict['rsrp']) == 0 or len(info_dict['rsrp']) == 0 or len(info_dict['rsrp']) == 0):
+                    quality_sink.write({'cell': cell, 'ue': ue,
+                        'avg_throughput': sum(info_dict['throughputs'])/len(info_dict['throughputs']),
+                        'avg_rsrq': sum(info_dict['rsrq'])/len(info_dict['rsrq']),
+                        'avg_rsrp': sum(info_dict['rsrp'])/len(info_dict['rsrp'])})
+
+            # print('duration', all_ues_durations)
+            all_ues_durations = np.array(all_ues_durations)
+            all_ues_distances = join_values(all_ues_distances)
+            all_ues_throughputs = join_values(all_ues_throughputs)
+            # print('cell', cell, 'rsrq', all_ues_rsrq)
+            all_ues_rsrq = join_values(all_ues_rsrq)
+            all_ues_rsrp = join_values(all_ues_rsrp)
+            
+            cell_info[cell] = {'durations': all_ues_durations, 'distances': all_ues_distances, 'rsrqs': all_ues_rsrq, 'rsrps': all_ues_rsrp, 
+                            'throughputs': all_ues_throughputs, 'handovers':  np.array([handovers])[0],
+                            'ue_connected': np.array([len(cell_connected_ue[cell].keys())])[0]}
+            
+        for cell in all_cells:
+            cell_info[cell] = {'durations': [0], 'distances': [0], 'rsrqs': [0], 'rsrps': [0], 
+                            'throughputs': [0], 'handovers': 0, 'ue_connected': 0}
+            
+        # print(cell_info)
+        return cell_connected_ue, cell_info
+
+    def find_max(self, cell_info, key):
+        max_arr = []
+        for cell, value in cell_info.items():
+            if len(value[key]) == 0:
+                max_arr.append(0)
+            else: max_arr.append(max(value[key]))
+        return max(max_arr)
+
+    def find_state(self, cell_info, ue_cell_connection, UE_Count, duration, episode, max_speed, min_speed):
+        # The per episode values go into the episode dictionary of the
+        # calling environment
+        state = []
+        episode['handovers_count'] = 0
+        episode['cell_rsrqs'] = []
+        episode['cell_throughputs'] = []
+        for cell, info in cell_info.items():
+            cell_state = np.zeros([gp.all_count])
+            for key, value in info.items():
+                if key == 'durations' or key == 'distances' or key == 'rsrqs' or key == 'throughputs' or key == 'rsrps':
+                    max_value = self.find_max(cell_info, key)
+                    # print(max_value, key)
+                    if len(value) == 0:
+                        avg = 0
+                        min_value = 0
+                        max_value = 0
+                    else:
+                        values = value/max_value
+                        avg = sum(values) / len(values)
+                        min_value = min(values)
+                        max_value = max(values)
+                    if key == 'durations':
+                        cell_state[0] = avg
+                        cell_state[1] = min_value
+                        cell_state[2] = max_value
+                    elif key == 'distances':
+                        cell_state[3] = avg
+                        cell_state[4] = min_value
+                        cell_state[5] = max_value
+                    elif key == 'rsrqs':
+                        cell_state[6] = avg
+                        episode['cell_rsrqs'].append(max_value)
+                    elif key == 'rsrps':
+                        cell_state[7] = avg
+                    elif key == 'throughputs':
+                        cell_state[8] = avg
+                        episode['cell_throughputs'].append(max_value)
+                if key == 'handovers':
+                    cell_state[9] = value/100
+                    episode['handovers_count'] += value
+                if key == 'ue_connected':
+                    cell_state[10] = value/10
+            state.extend(cell_state)
+        print('handovers', episode['handovers_count'])
+        state.append(UE_Count/gp.UE_upper_count)
+        state.append(max_speed)
+        state.append(min_speed)
+        state.append(duration)
+        return state
+
+    def find_reward(self, data, cell_connected_ue, duration, UE_Count, episode): #total time in 100 ms
+        HO_total = 0
+        throughput_total = 0
+        count = 0
+        rsrq_sum = 0
+
+        for cell in data.data['cell'].keys():
+            throughput_sum = 0
+            if(cell in cell_connected_ue.keys()):
+                for ue, info in cell_connected_ue[cell].items():
+                    throughput_sum += sum(info[-1]['throughputs'])
+                    rsrq_sum += sum(info[-1]['rsrq'])
+                    count += 1
+                    HO_total += len(info) - 1
+                cell_throughput = throughput_sum / (duration * 10)
+                throughput_total += cell_throughput
+
+        # print('handovers from reward', HO_total)
+        ANOH = HO_total / (UE_Count * duration * 10)
+        optimize_ratio = throughput_total / ANOH
+        rsrq_avg = rsrq_sum / count
+
+        episode['throughput_to_save'] = [throughput_total]
+        episode['rsrq_to_save'] = [rsrq_sum]
+
+        rsrq = rsrq_sum / duration * 10
+        return throughput_total / 50000
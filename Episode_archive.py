@@ -0,0 +1,142 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import atexit
+import glob
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+# On-disk corpus of the transitions the environments produced, so a new
+# experiment can fill its replay table from earlier runs instead of simulating
+# from scratch. Every environment writes its own chunks of transitions as
+# compressed .npz files: observation, action, reward and next observation,
+# plus one column per scenario parameter of the simulation (the arguments
+# HandoverEnv passes to the simulator). A chunk is written once it holds
+# chunk_size transitions or its first one is flush_seconds old, and when the
+# environment is closed, so a crash loses few simulations. Chunks are moved
+# into place complete, so a loader never sees a partial one.
+
+SCENARIO_FIELDS = ['NeighbourCellOffset', 'ServingCellThreshold', 'duration', 'UE_Count', 'ENB_Count',
+                   'x_pos', 'rho', 'y_pos', 'max_speed', 'min_speed', 'RngRun']
+
+class EpisodeArchive:
+    def __init__(self, directory, name, chunk_size=50, flush_seconds=60):
+        self.directory = directory
+        # Process id and start time keep the chunks of concurrent writers apart
+        self.prefix = '{}_{}_{}'.format(name, os.getpid(), int(time.time()))
+        self.chunk_size = chunk_size
+        self.flush_seconds = flush_seconds
+        self.chunks = 0
+        self.lock = threading.Lock()
+        self.reset_buffer()
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(self.close)
+
+    def reset_buffer(self):
+        self.buffer = {'observation': [], 'action': [], 'reward': [], 'next_observation': []}
+        self.buffer.update({name: [] for name in SCENARIO_FIELDS})
+        self.buffer_start = None
+
+    def add(self, observation, action, reward, next_observation, simulation):
+        with self.lock:
+            if self.buffer_start is None:
+                self.buffer_start = time.time()
+            self.buffer['observation'].append(np.asarray(observation, dtype=np.float64))
+            self.buffer['action'].append(np.asarray(action, dtype=np.float32))
+            self.buffer['reward'].append(reward)
+            self.buffer['next_observation'].append(np.asarray(next_observation, dtype=np.float64))
+            for name in SCENARIO_FIELDS:
+                self.buffer[name].append(simulation[name])
+            if (len(self.buffer['reward']) >= self.chunk_size
+                    or time.time() - self.buffer_start >= self.flush_seconds):
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.buffer['reward']:
+            return
+        arrays = {
+            'observation': np.stack(self.buffer['observation']),
+            'action': np.stack(self.buffer['action']),
+            'reward': np.array(self.buffer['reward'], dtype=np.float32),
+            'next_observation': np.stack(self.buffer['next_observation']),
+        }
+        arrays.update({name: np.array(self.buffer[name], dtype=np.int64) for name in SCENARIO_FIELDS})
+        path = os.path.join(self.directory, '{}_{:06d}.npz'.format(self.prefix, self.chunks))
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.chunks += 1
+        self.reset_buffer()
+
+    def close(self):
+        self.flush()
+
+def matches(chunk, scenario_filter):
+    # scenario_filter maps scenario parameters to one allowed value or a list
+    # of them, e.g. {'UE_Count': [7, 8], 'max_speed': 20}
+    mask = np.ones(len(chunk['reward']), dtype=bool)
+    for name, allowed in scenario_filter.items():
+        mask &= np.isin(chunk[name], np.atleast_1d(allowed))
+    return mask
+
+def load_transitions(directory, scenario_filter=None, observation_size=None, max_transitions=None):
+    # Yields the matching transitions chunk by chunk, newest chunks first, as
+    # dictionaries of arrays like the ones the archive writes
+    paths = sorted(glob.glob(os.path.join(directory, '*.npz')), key=os.path.getmtime, reverse=True)
+    loaded = 0
+    for path in paths:
+        if max_transitions is not None and loaded >= max_transitions:
+            break
+        with np.load(path) as f:
+            chunk = {name: f[name] for name in f.files}
+        if observation_size is not None and chunk['observation'].shape[1] != observation_size:
+            # Recorded with another number of cells
+            continue
+        mask = matches(chunk, scenario_filter or {})
+        chunk = {name: values[mask] for name, values in chunk.items()}
+        if max_transitions is not None:
+            chunk = {name: values[:max_transitions - loaded] for name, values in chunk.items()}
+        if len(chunk['reward']):
+            loaded += len(chunk['reward'])
+            yield chunk
+
+def warm_start(observer, directory, scenario_filter=None, observation_size=None, max_items=None):
+    # Writes the archived transitions to the replay table through observer,
+    # a ReverbAddTrajectoryObserver, the same way the collector writes them:
+    # every one step episode as its first step followed by the boundary step
+    # into the next episode. The observer is reset between chunks, so no
+    # sequence spans two unrelated streams of episodes. That makes two table
+    # items per transition, so max_items, e.g. the table capacity, allows
+    # half as many transitions and none are evicted as soon as written.
+    from tf_agents.trajectories import policy_step
+    from tf_agents.trajectories import time_step as ts
+    from tf_agents.trajectories import trajectory
+
+    max_transitions = None if max_items is None else max_items // 2
+    count = 0
+    for chunk in load_transitions(directory, scenario_filter, observation_size, max_transitions):
+        for observation, action, reward, next_observation in zip(
+                chunk['observation'], chunk['action'], chunk['reward'], chunk['next_observation']):
+            first = ts.restart(observation)
+            last = ts.termination(next_observation, reward)
+            step = policy_step.PolicyStep(action)
+            observer(trajectory.from_transition(first, step, last))
+            observer(trajectory.from_transition(last, step, first))
+            count += 1
+        observer.reset(write_cached_steps=False)
+    observer.close()
+    return count
@@ -0,0 +1,130 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import gzip
+import os
+import shutil
+import datatracker
+
+from Global_parameters import gp
+from Environment_parser import Environment_parser
+from Feature_engine import FeatureEngine
+from Scratch_space import ScratchSpace
+from Simulation_cache import SimulationCache, simulator_version
+from Simulator_backend import create_backend
+from Stage_profiler import profiler
+
+# Everything an episode needs apart from the agent: running the simulator (or
+# the replay backend) for one set of simulator inputs, parsing its trace and
+# turning it into the observation and the reward, with the cache of earlier
+# results in front. Nothing this module pulls in imports TensorFlow
+# (Stage_profiler and Episode_archive only import it inside the functions
+# that need it), so worker processes and analysis scripts can run and parse
+# episodes without TensorFlow's startup time and memory. HandoverEnv in
+# RL_environment is the tf_agents environment on top of it.
+
+class EpisodeRunner:
+    def __init__(self, name='collect'):
+        self.name = name
+        self.env_parser = Environment_parser()
+        # Every runner has its own scratch directory for the traces, so
+        # concurrent simulators never write to the same file
+        self.scratch = ScratchSpace(name, gp.scratch_root)
+        self.events_file_name = self.scratch.path('simulatorFile.txt')
+        self.backend = create_backend(self.env_parser, self.events_file_name)
+        # Replayed episodes stay out of the cache of ns-3 results, and a cache
+        # hit would skip the very work a replay load test is there to time
+        self.simulation_cache = None
+        if gp.use_simulation_cache and gp.simulator_backend == 'ns3':
+            self.simulation_cache = SimulationCache(gp.simulation_cache_dir, gp.simulation_cache_max_bytes,
+                                                    simulator_version(gp.simulator_binary))
+        # Whether the last run() came from the cache
+        self.cache_hit = False
+        # Where the trace of the last simulation is, the scratch file or the
+        # cache, None when it was not kept
+        self.trace = None
+
+    def lookup(self, simulation):
+        # The cached result of the simulation, None when there is none
+        result = None
+        if self.simulation_cache is not None:
+            result = self.simulation_cache.get(simulation)
+            profiler.count('cache_miss' if result is None else 'cache_hit')
+        self.cache_hit = result is not None
+        self.trace = None
+        if self.cache_hit and os.path.exists(self.simulation_cache.trace_path(simulation)):
+            self.trace = self.simulation_cache.trace_path(simulation)
+        return result
+
+    def run(self, simulation, episode=0, lookup=True):
+        # Result of the simulation, from the cache when it has it; episode
+        # numbers the copy of the trace archive_traces keeps. A caller that
+        # already looked the simulation up passes lookup=False. A failed
+        # simulation raises before anything goes into the cache
+        result = self.lookup(simulation) if lookup else None
+        if result is None:
+            result = self.simulate(simulation, episode)
+            if self.simulation_cache is not None:
+                trace_file = self.events_file_name if gp.cache_simulation_traces else None
+                self.simulation_cache.put(simulation, result, trace_file)
+        return result
+
+    def simulate(self, simulation, episode=0):
+        duration = simulation['duration']
+        UE_Count = simulation['UE_Count']
+        durration_in_ms = duration * 1000
+        keep_trace = gp.archive_traces or (self.simulation_cache is not None and gp.cache_simulation_traces)
+        if gp.incremental_features:
+            data = FeatureEngine(simulation['ENB_Count'], durration_in_ms)
+        else:
+            data = datatracker.Data()
+        self.trace = None
+        self.backend.run(simulation, data, keep_trace=keep_trace)
+        if keep_trace:
+            self.trace = self.events_file_name
+        if gp.archive_traces:
+            self.archive_trace(os.path.join(gp.trace_archive_dir, '{}_{}.txt'.format(self.name, episode)))
+
+        # The per episode values of find_state and find_reward are cached
+        # with the result, so a hit reports them too
+        episode_metrics = {}
+        if gp.incremental_features:
+            with profiler.stage('incremental_features'):
+                data.finalize()
+                state = data.find_state(UE_Count, duration, episode_metrics,
+                                        simulation['max_speed'], simulation['min_speed'])
+                reward = data.find_reward(duration, UE_Count, episode_metrics)
+            profiler.count('simulations')
+            return {'state': state, 'reward': reward, 'metrics': episode_metrics}
+
+        with profiler.stage('find_cell_ue_dicts'):
+            ue_cell_connection, cell_connected_ue = self.env_parser.find_cell_ue_dicts(data.data, durration_in_ms)
+        with profiler.stage('Add_more_cell_info'):
+            cell_connected_ue, cell_info = self.env_parser.Add_more_cell_info(data.data, cell_connected_ue)
+        with profiler.stage('find_state'):
+            state = self.env_parser.find_state(cell_info, ue_cell_connection, UE_Count, duration,
+                                episode_metrics, simulation['max_speed'], simulation['min_speed'])
+        with profiler.stage('find_reward'):
+            reward = self.env_parser.find_reward(data, cell_connected_ue, duration, UE_Count, episode_metrics)
+        profiler.count('simulations')
+        return {'state': state, 'reward': reward, 'metrics': episode_metrics}
+
+    def archive_trace(self, destination):
+        # Copy of the trace of the last simulation this runner looked up or
+        # ran. Traces are only kept with gp.archive_traces, or
+        # gp.cache_simulation_traces for the cached ones
+        if self.trace is None:
+            raise LookupError('The trace of the last simulation of {} was not kept; '
+                              'set gp.archive_traces or gp.cache_simulation_traces'.format(self.name))
+        if self.trace == self.events_file_name:
+            return self.scratch.archive('simulatorFile.txt', destination)
+        directory = os.path.dirname(destination)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with gzip.open(self.trace, 'rb') as source, open(destination, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        return destination
+
+    def close(self):
+        self.scratch.cleanup()
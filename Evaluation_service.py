@@ -0,0 +1,61 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from concurrent.futures import ThreadPoolExecutor
+
+from Stage_profiler import profiler
+
+# Runs the evaluators (EvaluationSuite) in background threads so the learner
+# keeps training while the evaluation simulations run. Each evaluator acts
+# with its own copy of the target policy; submit() refreshes that copy from
+# the live policy and records the train step it was taken at, and poll() hands
+# back the finished results together with that step. An evaluator that is
+# still busy when its next interval comes around is skipped for that interval.
+
+class PolicySnapshot:
+    def __init__(self, policy, update, step):
+        self.policy = policy
+        self.update = update
+        self.step = step
+
+class EvaluationService:
+    def __init__(self):
+        self.evaluators = {}
+        self.running = {}
+        self.executor = None
+
+    def add(self, name, evaluator, snapshot):
+        self.evaluators[name] = (evaluator, snapshot)
+
+    def busy(self, name):
+        return name in self.running
+
+    def submit(self, name, step):
+        if self.busy(name):
+            return False
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=len(self.evaluators), thread_name_prefix='evaluator')
+        evaluator, snapshot = self.evaluators[name]
+        # The snapshot is taken here, on the learner thread, between two train steps
+        snapshot.update()
+        self.running[name] = (step, self.executor.submit(evaluate, evaluator))
+        return True
+
+    def poll(self, wait=False):
+        finished = []
+        for name, (step, future) in list(self.running.items()):
+            if wait or future.done():
+                del self.running[name]
+                finished.append((name, step, future.result()))
+        return finished
+
+    def close(self):
+        finished = self.poll(wait=True)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        return finished
+
+def evaluate(evaluator):
+    with profiler.stage('evaluation'):
+        return evaluator.run()
@@ -0,0 +1,125 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import itertools
+import multiprocessing
+import multiprocessing.util
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Global_parameters import gp
+from Episode_runner import EpisodeRunner
+from Metrics_sink import close_sinks
+from Scenario_scheduler import SCENARIO_KEYS, scenario_simulation
+
+# Evaluation of one policy on a list of scenarios in one pass. A scenario is
+# a dictionary of the SCENARIO_KEYS values, plus an optional name; gp.eval_grid
+# adds every combination of its lists of values. An evaluation episode is a
+# single action on the observation HandoverEnv starts the scenario with, so
+# run() takes the actions of all scenarios from the policy first, on the
+# calling thread, and then simulates them on a pool of worker processes, one
+# EpisodeRunner each, so evaluation time goes down with the cores instead of
+# up with the scenarios. The workers start from a forkserver that imports
+# this module and nothing of TensorFlow, never from a fork of the process that
+# runs it, and get the gp settings of that process; the results come back with
+# the reward and the episode metrics of every scenario and their aggregate.
+
+def expand_grid(grid):
+    # Every combination of the lists of values in grid, by scenario key
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+def complete_scenario(scenario):
+    scenario = dict(scenario)
+    scenario.setdefault('min_speed', scenario.get('max_speed'))
+    scenario.setdefault('rho', 200)
+    missing = [key for key in SCENARIO_KEYS if scenario.get(key) is None]
+    if missing:
+        raise ValueError('Evaluation scenario {} misses {}'.format(scenario, missing))
+    if 'name' not in scenario:
+        scenario['name'] = '_'.join('{}{}'.format(key, scenario[key]) for key in SCENARIO_KEYS)
+    return scenario
+
+def initial_observation(scenario):
+    # The observation of HandoverEnv._reset for the scenario
+    observation = np.zeros(gp.all_sate)
+    observation[-4] = scenario['UE_Count'] / gp.UE_upper_count
+    observation[-3] = scenario['max_speed']
+    observation[-2] = scenario['min_speed']
+    observation[-1] = scenario['duration']
+    return observation
+
+# The runner of a worker process
+worker_runner = None
+
+def init_worker(settings):
+    global worker_runner
+    gp.__dict__.update(settings)
+    worker_runner = EpisodeRunner('eval_{}'.format(os.getpid()))
+    # Pool workers leave through os._exit, past atexit
+    multiprocessing.util.Finalize(None, worker_runner.close, exitpriority=0)
+    multiprocessing.util.Finalize(None, close_sinks, exitpriority=0)
+
+def run_simulation(simulation):
+    return worker_runner.run(simulation)
+
+def create_pool(workers):
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(['Evaluation_suite'])
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                               initializer=init_worker, initargs=(dict(vars(gp)),))
+
+class EvaluationSuite:
+    def __init__(self, scenarios, act, workers=None):
+        # act maps an observation to the action of the evaluated policy
+        self.scenarios = [complete_scenario(scenario) for scenario in scenarios]
+        if not self.scenarios:
+            raise ValueError('No evaluation scenarios')
+        # The report is keyed on the names
+        names = [scenario['name'] for scenario in self.scenarios]
+        duplicates = sorted(set(name for name in names if names.count(name) > 1))
+        if duplicates:
+            raise ValueError('Evaluation scenario names {} are not unique'.format(duplicates))
+        self.act = act
+        self.workers = workers or min(len(self.scenarios), os.cpu_count() or 1)
+        self.executor = None
+
+    def run(self):
+        actions = [np.asarray(self.act(initial_observation(scenario)), dtype=np.float32)
+                   for scenario in self.scenarios]
+        if self.executor is None:
+            self.executor = create_pool(self.workers)
+        results = self.executor.map(
+            run_simulation, [scenario_simulation(scenario, action) for scenario, action in zip(self.scenarios, actions)])
+        return self.report(actions, list(results))
+
+    def report(self, actions, results):
+        scenarios = {}
+        for scenario, action, result in zip(self.scenarios, actions, results):
+            metrics = result['metrics']
+            scenarios[scenario['name']] = {
+                'return': result['reward'],
+                'action': action,
+                'handovers': metrics['handovers_count'],
+                'throughput': metrics['throughput_to_save'],
+                'rsrq': metrics['rsrq_to_save'],
+                'cell_throughputs': metrics['cell_throughputs'],
+                'cell_rsrqs': metrics['cell_rsrqs'],
+            }
+        returns = np.array([result['reward'] for result in results])
+        return {
+            'AverageReturn': float(returns.mean()),
+            'MinReturn': float(returns.min()),
+            'MaxReturn': float(returns.max()),
+            'StdReturn': float(returns.std()),
+            'AverageHandovers': float(np.mean([values['handovers'] for values in scenarios.values()])),
+            'scenarios': scenarios,
+        }
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
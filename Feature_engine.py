@@ -0,0 +1,364 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import math
+from collections import deque
+
+import numpy as np
+
+from Global_parameters import gp
+from Metrics_sink import get_sink
+
+# Incremental version of find_cell_ue_dicts, Add_more_cell_info, find_state
+# and find_reward. FeatureEngine takes the trace records through the same
+# append() as datatracker.Data, so parse_lines can feed it straight from the
+# simulator pipe, and folds every sample into running aggregates (count, sum,
+# min, max) of the connection interval it belongs to. Memory grows with the
+# number of cells, UEs and handovers instead of the trace length, and the
+# state and reward are ready as soon as the trace ends.
+#
+# A connection interval starts at the association time rounded to 100 ms and
+# ends where the next one of the UE starts, so its bounds can lie up to 50 ms
+# before the record that sets them. Samples are therefore held back until the
+# trace is PENDING_MS past them and only then added to the intervals they
+# fall in. What depends on the order Add_more_cell_info walks the intervals in
+# (the distance carried into 100 ms steps without coordinates, and the zero
+# RSRQ/RSRP sample of a UE that never reported the cell) is settled in
+# finalize(). The results match the batch functions up to float rounding of
+# the sums.
+
+PENDING_MS = 50
+STEP_MS = 100
+
+# Kinds of the held back samples
+COORDS = 'coords'
+BYTES_RX = 'bytes_rx'
+RSRQ = 'rsrq'
+RSRP = 'rsrp'
+
+class Aggregate:
+    __slots__ = ('count', 'total', 'minimum', 'maximum')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value, n=1):
+        self.count += n
+        self.total += value * n
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other):
+        if other.count:
+            self.count += other.count
+            self.total += other.total
+            if self.minimum is None or other.minimum < self.minimum:
+                self.minimum = other.minimum
+            if self.maximum is None or other.maximum > self.maximum:
+                self.maximum = other.maximum
+
+class Interval:
+    __slots__ = ('cell', 'start', 'end', 'rsrq', 'rsrp', 'throughput', 'distance',
+                 'next_step', 'last_distance', 'leading_missing', 'point')
+
+    def __init__(self, cell, start):
+        self.cell = cell
+        self.start = start
+        # None until the next association of the UE closes it
+        self.end = None
+        self.rsrq = Aggregate()
+        self.rsrp = Aggregate()
+        self.throughput = Aggregate()
+        self.distance = Aggregate()
+        self.next_step = start
+        self.last_distance = None
+        # 100 ms steps without coordinates before the first one with them;
+        # they take the distance carried over from the previous interval
+        self.leading_missing = 0
+        # Samples at start alone, kept while the interval may still turn out
+        # to be empty (see FeatureEngine.associate)
+        self.point = None
+
+    def collapse(self):
+        point = self.point
+        for name in ('rsrq', 'rsrp', 'throughput', 'distance', 'next_step', 'last_distance', 'leading_missing'):
+            setattr(self, name, getattr(point, name))
+        self.end = self.start
+        self.point = None
+
+    def add_steps(self, missing, distance=None):
+        if missing > 0:
+            if self.last_distance is None:
+                self.leading_missing += missing
+            else:
+                self.distance.add(self.last_distance, missing)
+        if distance is not None:
+            self.distance.add(distance)
+            self.last_distance = distance
+
+class UEState:
+    __slots__ = ('intervals', 'active', 'keys', 'previous_cell', 'last_coords_step', 'last_bytes_step')
+
+    def __init__(self):
+        # cell -> intervals, in the order the UE first associated with the cells
+        self.intervals = {}
+        self.active = []
+        self.keys = set()
+        self.previous_cell = None
+        self.last_coords_step = None
+        self.last_bytes_step = None
+
+class FeatureEngine:
+    def __init__(self, enb_count, durration_in_ms):
+        self.enb_count = enb_count
+        self.last_ms = durration_in_ms - 1
+        # First coordinates of every cell and the UEs, both in the order the
+        # trace introduces them, like the keys of Data
+        self.cells = {}
+        self.ues = {}
+        self.pending = deque()
+        self.measurement_keys = {}
+        self.now = None
+        self.finalized = False
+
+    def append(self, timestep, obj_type, obj_id, key, value):
+        if timestep != self.now:
+            self.now = timestep
+            # Past the episode an open interval ends at last_ms but a later
+            # association can still close it further on, so samples there
+            # wait for finalize()
+            self.commit(min(timestep - PENDING_MS, self.last_ms + 1))
+        if obj_type == 'cell':
+            if key == 'coords':
+                self.cells.setdefault(obj_id, value)
+            return
+        ue = self.ues.get(obj_id)
+        if ue is None:
+            ue = self.ues[obj_id] = UEState()
+        if key == 'coords':
+            # Only the first sample of every 100 ms step counts
+            if timestep % STEP_MS or timestep == ue.last_coords_step:
+                return
+            ue.last_coords_step = timestep
+            self.pending.append((timestep, ue, COORDS, value))
+        elif key == 'bytes_rx':
+            if timestep % STEP_MS or timestep == ue.last_bytes_step:
+                return
+            ue.last_bytes_step = timestep
+            self.pending.append((timestep, ue, BYTES_RX, value))
+        elif key == 'cell_associated':
+            self.associate(ue, timestep, value)
+        else:
+            # rsrq_for_<cell> and rsrp_for_<cell>
+            measurement = self.measurement_keys.get(key)
+            if measurement is None:
+                measurement = self.measurement_keys[key] = (RSRQ if key[:4] == 'rsrq' else RSRP, int(key[9:]))
+            ue.keys.add(key)
+            self.pending.append((timestep, ue, measurement, value))
+
+    def associate(self, ue, timestep, cell):
+        start = round(timestep, -2)
+        interval = Interval(cell, start)
+        intervals = ue.intervals.setdefault(cell, [])
+        if ue.previous_cell == cell:
+            # find_cell_ue_dicts closes the last interval of the previous
+            # cell, which here is the new one itself: it ends at its start and
+            # the one before stays open to the end of the trace. The next
+            # association with another cell moves that end again, so the new
+            # interval collects samples like an open one until then and keeps
+            # the ones at its start apart in case it stays empty.
+            if intervals[-1].point is not None:
+                intervals[-1].collapse()
+            interval.point = Interval(cell, start)
+            interval.point.end = start
+        elif ue.previous_cell is not None:
+            closed = ue.intervals[ue.previous_cell][-1]
+            closed.end = start
+            closed.point = None
+        intervals.append(interval)
+        ue.previous_cell = cell
+        ue.active.append(interval)
+
+    def commit(self, before):
+        pending = self.pending
+        add_sample = self.add_sample
+        while pending and pending[0][0] < before:
+            add_sample(*pending.popleft())
+
+    def add_sample(self, timestep, ue, kind, value):
+        intervals = []
+        stale = False
+        for interval in ue.active:
+            end = interval.end
+            if end is None:
+                end = self.last_ms
+            elif end < timestep:
+                # Closed for good, since the samples come in time order
+                stale = True
+                continue
+            if interval.start <= timestep <= end:
+                intervals.append(interval)
+            # A reopened interval may start past the episode
+            if interval.point is not None and timestep == interval.start:
+                intervals.append(interval.point)
+        if stale:
+            ue.active = [interval for interval in ue.active if interval.end is None or interval.end >= timestep]
+        if not intervals:
+            return
+        if kind is COORDS:
+            for interval in intervals:
+                cell_x, cell_y = self.cells[interval.cell]
+                distance = math.sqrt((value[0] - cell_x)**2 + (value[1] - cell_y)**2)
+                interval.add_steps((timestep - interval.next_step) // STEP_MS, distance)
+                interval.next_step = timestep + STEP_MS
+        elif kind is BYTES_RX:
+            for interval in intervals:
+                interval.throughput.add(value)
+        else:
+            quantity, cell = kind
+            for interval in intervals:
+                if interval.cell == cell:
+                    if quantity is RSRQ:
+                        interval.rsrq.add(value)
+                    else:
+                        interval.rsrp.add(value)
+
+    def finalize(self):
+        if self.finalized:
+            return
+        self.finalized = True
+        self.commit(math.inf)
+        last_ms = self.last_ms
+        for ue in self.ues.values():
+            for intervals in ue.intervals.values():
+                for interval in intervals:
+                    if interval.point is not None:
+                        interval.collapse()
+
+        # Cells and their UEs in the order find_cell_ue_dicts creates them
+        self.cell_connected_ue = {}
+        for imsi, ue in self.ues.items():
+            for cell in ue.intervals:
+                self.cell_connected_ue.setdefault(cell, {})[imsi] = ue
+
+        quality_sink = get_sink(gp.rsrq_throughput_file, gp.metrics_flush_interval)
+        self.cell_info = {}
+        self.connections = {}
+        distance = math.nan
+        for cell, connected in self.cell_connected_ue.items():
+            info = {key: Aggregate() for key in ('durations', 'distances', 'rsrqs', 'rsrps', 'throughputs')}
+            handovers = 0
+            for imsi, ue in connected.items():
+                rsrq, rsrp, throughput = Aggregate(), Aggregate(), Aggregate()
+                duration_ue = 0
+                for interval in ue.intervals[cell]:
+                    handovers += 1
+                    end = last_ms if interval.end is None else interval.end
+                    duration_ue += end - interval.start
+                    # A UE without a single report of the cell has one zero
+                    # sample per interval
+                    if 'rsrq_for_' + str(cell) in ue.keys:
+                        rsrq.merge(interval.rsrq)
+                    else:
+                        rsrq.add(0)
+                    if 'rsrp_for_' + str(cell) in ue.keys:
+                        rsrp.merge(interval.rsrp)
+                    else:
+                        rsrp.add(0)
+                    if end < interval.start:
+                        continue
+                    last_step = interval.start + (end - interval.start) // STEP_MS * STEP_MS
+                    interval.add_steps((last_step - interval.next_step) // STEP_MS + 1)
+                    interval.next_step = last_step + STEP_MS
+                    if interval.leading_missing:
+                        info['distances'].add(distance, interval.leading_missing)
+                    info['distances'].merge(interval.distance)
+                    if interval.last_distance is not None:
+                        distance = interval.last_distance
+                    throughput.merge(interval.throughput)
+                info['durations'].add(duration_ue)
+                info['rsrqs'].merge(rsrq)
+                info['rsrps'].merge(rsrp)
+                info['throughputs'].merge(throughput)
+                self.connections[(cell, imsi)] = (throughput.total, rsrq.total)
+                if rsrp.count:
+                    quality_sink.write({'cell': cell, 'ue': imsi,
+                        'avg_throughput': throughput.total/throughput.count,
+                        'avg_rsrq': rsrq.total/rsrq.count,
+                        'avg_rsrp': rsrp.total/rsrp.count})
+            info['handovers'] = handovers
+            info['ue_connected'] = len(connected)
+            self.cell_info[cell] = info
+
+        for cell in range(1, self.enb_count+1):
+            if cell not in self.cell_info:
+                info = {}
+                for key in ('durations', 'distances', 'rsrqs', 'rsrps', 'throughputs'):
+                    info[key] = Aggregate()
+                    info[key].add(0)
+                info['handovers'] = 0
+                info['ue_connected'] = 0
+                self.cell_info[cell] = info
+        self.pending = None
+
+    def find_max(self, key):
+        return max(info[key].maximum if info[key].count else 0 for info in self.cell_info.values())
+
+    def find_state(self, UE_Count, duration, episode, max_speed, min_speed):
+        self.finalize()
+        state = []
+        episode['handovers_count'] = 0
+        episode['cell_rsrqs'] = []
+        episode['cell_throughputs'] = []
+        max_values = {key: np.float64(self.find_max(key))
+                      for key in ('durations', 'distances', 'rsrqs', 'rsrps', 'throughputs')}
+        for cell, info in self.cell_info.items():
+            cell_state = np.zeros([gp.all_count])
+            summaries = {}
+            for key, max_value in max_values.items():
+                aggregate = info[key]
+                if aggregate.count == 0:
+                    summaries[key] = (0, 0, 0)
+                else:
+                    summaries[key] = (np.float64(aggregate.total) / max_value / aggregate.count,
+                                      np.float64(aggregate.minimum) / max_value,
+                                      np.float64(aggregate.maximum) / max_value)
+            cell_state[0:3] = summaries['durations']
+            cell_state[3:6] = summaries['distances']
+            cell_state[6] = summaries['rsrqs'][0]
+            episode['cell_rsrqs'].append(summaries['rsrqs'][2])
+            cell_state[7] = summaries['rsrps'][0]
+            cell_state[8] = summaries['throughputs'][0]
+            episode['cell_throughputs'].append(summaries['throughputs'][2])
+            cell_state[9] = info['handovers']/100
+            episode['handovers_count'] += info['handovers']
+            cell_state[10] = info['ue_connected']/10
+            state.extend(cell_state)
+        print('handovers', episode['handovers_count'])
+        state.append(UE_Count/gp.UE_upper_count)
+        state.append(max_speed)
+        state.append(min_speed)
+        state.append(duration)
+        return state
+
+    def find_reward(self, duration, UE_Count, episode):
+        self.finalize()
+        throughput_total = 0
+        rsrq_sum = 0
+        for cell in self.cells:
+            if cell in self.cell_connected_ue:
+                throughput_sum = 0
+                for imsi in self.cell_connected_ue[cell]:
+                    throughput, rsrq = self.connections[(cell, imsi)]
+                    throughput_sum += throughput
+                    rsrq_sum += rsrq
+                throughput_total += throughput_sum / (duration * 10)
+        episode['throughput_to_save'] = [throughput_total]
+        episode['rsrq_to_save'] = [rsrq_sum]
+        return throughput_total / 50000
@@ -0,0 +1,127 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+
+from Run_state import RingBuffer
+
+# Curriculum over the simulated duration of the training episodes. Training
+# starts with short simulations, durations[0] seconds, and moves up one level
+# at a time until the episodes run the full duration of their scenario. The
+# reward is a rate over the simulated duration and keeps its scale across the
+# levels; the state does not, it holds the raw handover counts of the cells and
+# the simulated duration. HandoverEnv picks the duration of an episode on
+# reset and puts it in the observation the policy acts on, so the agent sees
+# which level an episode is from. A level is left
+#   'step'      once the learner reaches the next of `steps` train steps
+#   'variance'  once min_episodes were simulated at it and the rewards of the
+#               last `window` of them vary by less than variance_threshold
+#               (standard deviation over mean), i.e. training has settled
+# Only the training environments get a scheduler; evaluation always runs at
+# full duration. Every simulated episode is recorded with its wall time, so
+# the simulated seconds per wall second show what the short episodes save;
+# episodes the simulation cache answered are counted apart and left out of it.
+
+class FidelityScheduler:
+    def __init__(self, durations, schedule='step', steps=(), window=50, min_episodes=100,
+                 variance_threshold=0.05):
+        if schedule not in ('step', 'variance'):
+            raise ValueError('Unknown fidelity schedule {}'.format(schedule))
+        self.durations = list(durations)
+        self.schedule = schedule
+        self.steps = list(steps)
+        self.min_episodes = min_episodes
+        self.variance_threshold = variance_threshold
+        self.level = 0
+        self.level_episodes = 0
+        self.rewards = RingBuffer(window)
+        self.simulated_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.cache_hits = 0
+        self.recent_simulated = RingBuffer(window)
+        self.recent_wall = RingBuffer(window)
+        self.lock = threading.Lock()
+
+    def full_fidelity(self):
+        return self.level >= len(self.durations)
+
+    def duration(self, scenario_duration):
+        # Duration to simulate an episode of the scenario with
+        with self.lock:
+            if self.full_fidelity():
+                return scenario_duration
+            return min(self.durations[self.level], scenario_duration)
+
+    def advance(self, step):
+        # Called with the train step of the learner
+        if self.schedule != 'step':
+            return
+        with self.lock:
+            while not self.full_fidelity() and self.level < len(self.steps) and step >= self.steps[self.level]:
+                self.next_level('train step {}'.format(step))
+
+    def record(self, duration, reward, wall_seconds, cache_hit=False):
+        with self.lock:
+            if cache_hit:
+                self.cache_hits += 1
+            else:
+                self.simulated_seconds += duration
+                self.wall_seconds += wall_seconds
+                self.recent_simulated.append(duration)
+                self.recent_wall.append(wall_seconds)
+            if self.schedule != 'variance' or self.full_fidelity():
+                return
+            self.level_episodes += 1
+            self.rewards.append(reward)
+            if self.level_episodes >= self.min_episodes and len(self.rewards) == self.rewards.capacity:
+                rewards = self.rewards.values()
+                mean = abs(rewards.mean())
+                if mean > 0 and rewards.std() / mean < self.variance_threshold:
+                    self.next_level('reward variation {:.4f}'.format(rewards.std() / mean))
+
+    def next_level(self, reason):
+        self.level += 1
+        self.level_episodes = 0
+        self.rewards.clear()
+        if self.full_fidelity():
+            print('Fidelity: full duration after', reason)
+        else:
+            print('Fidelity: {} s episodes after {}'.format(self.durations[self.level], reason))
+
+    def get_state(self):
+        # Level and reward window, for training checkpoints
+        with self.lock:
+            return {
+                'level': self.level,
+                'level_episodes': self.level_episodes,
+                'rewards': self.rewards.values().tolist(),
+                'simulated_seconds': self.simulated_seconds,
+                'wall_seconds': self.wall_seconds,
+                'cache_hits': self.cache_hits,
+            }
+
+    def set_state(self, state):
+        with self.lock:
+            self.level = state['level']
+            self.level_episodes = state['level_episodes']
+            self.rewards.clear()
+            for reward in state['rewards']:
+                self.rewards.append(reward)
+            self.simulated_seconds = state['simulated_seconds']
+            self.wall_seconds = state['wall_seconds']
+            self.cache_hits = state['cache_hits']
+
+    def summary(self):
+        with self.lock:
+            recent_wall = self.recent_wall.values().sum()
+            return {
+                'level': self.level,
+                'duration': None if self.full_fidelity() else self.durations[self.level],
+                'simulated_seconds': self.simulated_seconds,
+                'wall_seconds': self.wall_seconds,
+                'cache_hits': self.cache_hits,
+                'sim_seconds_per_wall_second': self.simulated_seconds / self.wall_seconds if self.wall_seconds else None,
+                'recent_sim_seconds_per_wall_second':
+                    float(self.recent_simulated.values().sum() / recent_wall) if recent_wall else None,
+            }
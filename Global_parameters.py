@@ -1,79 +1,197 @@
-
-class Global_parameters:
-    def __init__(self) -> None:
-        self.num_iterations = 100000 
-
-        self.initial_collect_steps = 500 
-        self.collect_steps_per_iteration = 1 
-        self.replay_buffer_capacity = 10000 
-
-        self.batch_size = 5 
-
-        self.critic_learning_rate = 1e-3 
-        self.actor_learning_rate = 1e-4 
-        self.alpha_learning_rate = 1e-3 
-        self.target_update_tau = 0.005 
-        self.target_update_period = 1 
-        self.gamma = 0.99999999 
-        self.reward_scale_factor = 1.0 
-
-        self.others = 4
-        self.all_count = 11
-        self.UE_upper_count = 18
-
-        self.log_interval = 1 
-
-        self.eval_interval = 10 
-        self.eval2_interval = 15
-
-        self.policy_save_interval = 500 
-
-        self.ENB_Count = 5
-        self.upper_limit = 34
-        self.lower_limit = 0
-
-        self.all_sate = (self.ENB_Count*self.all_count)+self.others
-
-        self.actor_fc_layer_params = (self.all_sate, self.all_sate)
-        self.critic_joint_fc_layer_params = (self.all_sate, self.all_sate)
-
-        self.handovers_count = 0
-        self.actions = []
-        self.action__ = []
-        self.reward_ = 0
-        self.throughput_to_save = []
-        self.rsrq_to_save = []
-        self.cell_rsrqs = []
-        self.cell_throughputs = []
-        self.max_speed = 0
-        self.min_speed = 0
-        self.duration = 0
-        self.ues = 0
-
-        self.eval_actions = []
-        self.eval_reward_ = 0
-        self.eval_throughput_to_save = []
-        self.eval_handovers_count = 0
-        self.eval_action__ = []
-        self.eval_rsrq_to_save = []
-        self.eval_cell_rsrqs = []
-        self.eval_cell_throughputs = []
-        self.eval_max_speed = 0
-        self.eval_min_speed = 0
-
-        self.eval2_actions = []
-        self.eval2_reward_ = 0
-        self.eval2_throughput_to_save = []
-        self.eval2_handovers_count = 0
-        self.eval2_action__ = []
-        self.eval2_rsrq_to_save = []
-        self.eval2_cell_rsrqs = []
-        self.eval2_cell_throughputs = []
-        self.eval2_max_speed = 0
-        self.eval2_min_speed = 0
-
-        self.file_name = 'output/logFile.txt'
-        self.events_file_name = 'output/simulatorFile.txt'
-        self.rsrq_throughput_file = 'output/qualityValues.txt'
-
+
+class Global_parameters:
+    def __init__(self) -> None:
+        self.num_iterations = 100000 
+
+        self.initial_collect_steps = 500 
+        self.collect_steps_per_iteration = 1 
+        self.num_collect_workers = 1
+        # Simulate the next collect episode while the learner trains, acting
+        # with a copy of the collect policy at most max_policy_staleness
+        # train steps old
+        self.pipelined_collection = False
+        self.max_policy_staleness = 1
+        self.replay_buffer_capacity = 10000 
+
+        self.batch_size = 5 
+
+        self.critic_learning_rate = 1e-3 
+        self.actor_learning_rate = 1e-4 
+        self.alpha_learning_rate = 1e-3 
+        self.target_update_tau = 0.005 
+        self.target_update_period = 1 
+        self.gamma = 0.99999999 
+        self.reward_scale_factor = 1.0 
+
+        self.others = 4
+        self.all_count = 11
+        self.UE_upper_count = 18
+
+        self.log_interval = 1 
+
+        self.eval_interval = 10 
+        # Run the evaluation in the background on a snapshot of the policy
+        self.async_evaluation = True
+        # Scenarios of the evaluation suite (Evaluation_suite.py): the
+        # dictionaries in eval_scenarios, then every combination of the lists
+        # of values in eval_grid (e.g. {'UE_Count': [7, 9], 'max_speed': [20,
+        # 70], ...}), simulated on eval_workers processes (None: one per
+        # scenario, at most one per core)
+        self.eval_scenarios = [
+            {'name': 'eval', 'duration': 70, 'UE_Count': 8, 'min_speed': 20, 'max_speed': 20,
+             'x_pos': 200, 'y_pos': 300, 'rho': 200, 'RngRun': 100},
+            {'name': 'eval2', 'duration': 80, 'UE_Count': 8, 'min_speed': 70, 'max_speed': 70,
+             'x_pos': 300, 'y_pos': 100, 'rho': 200, 'RngRun': 350},
+        ]
+        self.eval_grid = None
+        self.eval_workers = None
+        # Landscape_scanner.py writes the reward surfaces of the scenarios to
+        # landscape_dir
+        self.landscape_dir = 'output/landscapes'
+
+        self.policy_save_interval = 500 
+
+        # Distributed_training.py: the Reverb server listens on reverb_port of
+        # localhost, the learner publishes the policy every
+        # policy_push_interval train steps and each of the
+        # num_collect_workers actors picks it up every policy_pull_interval
+        # episodes
+        self.reverb_port = 8008
+        self.policy_push_interval = 10
+        self.policy_pull_interval = 1
+        # Seconds the actors get to finish their episode after the learner is
+        # done, before they are terminated
+        self.actor_stop_timeout = 300
+        # The learner there samples about samples_per_insert items per item
+        # the actors insert, as the single process loop does with one
+        # episode per train step of batch_size samples, and may run ahead or
+        # behind by samples_per_insert_error samples; it starts once the table
+        # holds replay_min_size items
+        self.samples_per_insert = 5.0
+        self.samples_per_insert_error = 1000.0
+        self.replay_min_size = 50
+
+        self.ENB_Count = 5
+        self.upper_limit = 34
+        self.lower_limit = 0
+
+        self.all_sate = (self.ENB_Count*self.all_count)+self.others
+
+        self.actor_fc_layer_params = (self.all_sate, self.all_sate)
+        self.critic_joint_fc_layer_params = (self.all_sate, self.all_sate)
+
+        # Agent, optimizers, train step, replay table and environment counters
+        # are saved every checkpoint_interval train steps, and a new run picks
+        # up from the latest checkpoint when resume_training is set; otherwise
+        # it starts with a new agent and an empty replay table
+        self.checkpoint_dir = 'output/checkpoints'
+        self.checkpoint_interval = 1000
+        self.checkpoints_to_keep = 3
+        self.async_checkpoint = True
+        self.resume_training = False
+
+        # Training transitions are archived in chunks of episode_archive_chunk
+        # transitions, or of what episode_archive_flush_seconds collected,
+        # under episode_archive_dir; a new run fills the replay table from
+        # the archive in warm_start_dir first, keeping the transitions whose
+        # scenario matches warm_start_filter (e.g. {'UE_Count': [7, 8]})
+        self.archive_episodes = False
+        self.episode_archive_dir = 'output/episode_archive'
+        self.episode_archive_chunk = 50
+        self.episode_archive_flush_seconds = 60
+        self.warm_start_dir = None
+        self.warm_start_filter = {}
+
+        # Training episodes come from the surrogate model (Surrogate_model.py)
+        # instead of the simulator once it has seen surrogate_min_samples
+        # simulated episodes, its ensemble spread on the reward is below
+        # surrogate_max_uncertainty and its RMSE on the recent simulated
+        # episodes below surrogate_max_error; surrogate_audit_rate of those
+        # are simulated anyway to track its accuracy
+        self.use_surrogate = False
+        self.surrogate_members = 5
+        self.surrogate_min_samples = 50
+        self.surrogate_max_uncertainty = 0.1
+        self.surrogate_max_error = 0.2
+        self.surrogate_audit_rate = 0.1
+
+        # Training episodes simulate fidelity_durations[level] seconds (at most
+        # the duration of their scenario) instead of the full duration, one
+        # level after the other (Fidelity_scheduler.py); fidelity_schedule
+        # 'step' moves up at the train steps in fidelity_steps, 'variance'
+        # once the last fidelity_window rewards of a level, of at least
+        # fidelity_min_episodes, vary by less than fidelity_variance_threshold
+        # of their mean. None always simulates the full duration
+        self.fidelity_schedule = None
+        self.fidelity_durations = [20, 30, 45]
+        self.fidelity_steps = [2000, 5000, 10000]
+        self.fidelity_window = 50
+        self.fidelity_min_episodes = 100
+        self.fidelity_variance_threshold = 0.05
+
+        # Training scenarios, RngRun included, come from a fixed pool
+        # (Scenario_scheduler.py) of scenario_pool_size scenarios drawn from
+        # scenario_pool_seed, or the JSON list in scenario_pool_file, so
+        # actions are compared on the same random numbers and repeated ones
+        # hit the simulation cache. None for both draws every scenario anew
+        self.scenario_pool_size = None
+        self.scenario_pool_seed = 0
+        self.scenario_pool_file = None
+
+        # Episodes each environment keeps in its run state (Run_state.py)
+        self.run_state_capacity = 1000
+
+        # Metric logs are JSON lines ('.jsonl') or CSV ('.csv', one file per
+        # record type), written in batches of metrics_flush_interval records
+        self.file_name = 'output/logFile.jsonl'
+        self.rsrq_throughput_file = 'output/qualityValues.jsonl'
+        self.metrics_flush_interval = 100
+        # Columnar store Log_store.py tails the logs into, in chunks of
+        # log_store_chunk rows
+        self.log_store_dir = 'output/log_store'
+        self.log_store_chunk = 10000
+
+        # Per stage timers of the episode pipeline, summarized every
+        # profile_report_interval train steps into profile_stats_file and
+        # TensorBoard
+        self.profile_stages = False
+        self.profile_report_interval = 100
+        self.profile_stats_file = 'output/stageStats.jsonl'
+
+        # 'ns3' runs simulator_binary; 'replay' serves the traces in
+        # replay_trace_dir (as recorded with cache_simulation_traces), or
+        # synthetic traces when replay_synthetic and there is no recording,
+        # each after replay_latency seconds, for load tests without ns-3
+        self.simulator_backend = 'ns3'
+        self.simulator_binary = './simulator'
+        self.replay_trace_dir = 'output/simulation_cache'
+        self.replay_latency = 0.0
+        self.replay_synthetic = True
+        self.replay_handover_rate = 0.05
+
+        # Parse the simulator stdout while it runs instead of reading the trace
+        # back from a file
+        self.stream_simulator_output = True
+
+        # Fold the trace into the state and reward features while it is
+        # parsed (Feature_engine) instead of storing it all and walking it
+        # afterwards
+        self.incremental_features = True
+
+        # Every environment writes its traces to a private scratch directory
+        # under scratch_root (None picks /dev/shm when there is one), removed
+        # when the run ends; archive_traces copies every trace to
+        # trace_archive_dir first. Only with archive_traces (or a cached trace,
+        # cache_simulation_traces) can a trace be archived on request
+        self.scratch_root = None
+        self.archive_traces = False
+        self.trace_archive_dir = 'output/traces'
+
+        # Results of earlier simulations with the same integer inputs are read
+        # back from disk instead of running ns-3 again
+        self.use_simulation_cache = True
+        self.simulation_cache_dir = 'output/simulation_cache'
+        self.simulation_cache_max_bytes = 1024 * 1024 * 1024
+        self.cache_simulation_traces = False
+
 gp = Global_parameters()
\ No newline at end of file
@@ -0,0 +1,173 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import as_completed
+
+import numpy as np
+
+from Global_parameters import gp
+from Evaluation_suite import complete_scenario, create_pool, expand_grid, run_simulation, scenario_simulation
+from Metrics_sink import get_sink, close_sinks
+
+# Reward surface of a scenario over the action box, NeighbourCellOffset x
+# ServingCellThreshold from gp.lower_limit to gp.upper_limit, to judge the
+# actions of the agent against. The simulator truncates the actions to
+# integers, so every float action in [n, n+1) x [m, m+1) runs the same
+# simulation and the surface is complete with the integer pairs. The scan
+# starts with the pairs coarse_step apart and halves the step in rounds down to
+# 1, each round only inside the cells of the last one whose corner rewards
+# differ the most (refine_fraction of them) or that hold the best rewards (the
+# top ones), so the steep and the promising regions get the full resolution.
+# The simulations of a round run on a pool of TensorFlow-free workers
+# (Evaluation_suite), in front of the simulation cache training uses.
+#
+# Every scenario has a directory under --output with scenario.json, the
+# evaluated pairs in points.jsonl, appended as they finish, and surface.npz,
+# the reward, handover, throughput and RSRQ arrays (NaN where the scan did not
+# go) rewritten after every round. A scan that was interrupted picks up from
+# points.jsonl and simulates only the pairs it does not have yet.
+
+def axis(lower, upper, step):
+    # lower to upper, step apart, with upper always in
+    values = list(range(lower, upper + 1, step))
+    if values[-1] != upper:
+        values.append(upper)
+    return values
+
+class Landscape:
+    def __init__(self, directory, scenario):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        scenario_path = os.path.join(directory, 'scenario.json')
+        if os.path.exists(scenario_path):
+            with open(scenario_path, 'r') as f:
+                saved = json.load(f)
+            if saved != scenario:
+                raise ValueError('{} holds the landscape of another scenario, {}'.format(directory, saved))
+        else:
+            with open(scenario_path, 'w') as f:
+                json.dump(scenario, f)
+        self.points = {}
+        points_path = os.path.join(directory, 'points.jsonl')
+        if os.path.exists(points_path):
+            self.load(points_path)
+        self.sink = get_sink(points_path, 1)
+
+    def load(self, points_path):
+        with open(points_path, 'rb+') as f:
+            data = f.read()
+            # A line cut off by an interruption is simulated again
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                f.truncate(end)
+        for line in data[:end].decode().splitlines():
+            record = json.loads(line)
+            self.points[(record['offset'], record['threshold'])] = record
+
+    def add(self, point, result):
+        metrics = result['metrics']
+        record = {
+            'offset': point[0],
+            'threshold': point[1],
+            'reward': result['reward'],
+            'handovers': metrics['handovers_count'],
+            'throughput': metrics['throughput_to_save'][0],
+            'rsrq': metrics['rsrq_to_save'][0],
+        }
+        self.points[point] = record
+        self.sink.write(record)
+
+    def reward(self, point):
+        record = self.points.get(point)
+        return None if record is None else record['reward']
+
+    def save(self, lower, upper):
+        size = upper - lower + 1
+        surfaces = {name: np.full((size, size), np.nan) for name in ('reward', 'handovers', 'throughput', 'rsrq')}
+        for (offset, threshold), record in self.points.items():
+            for name, surface in surfaces.items():
+                surface[offset - lower, threshold - lower] = record[name]
+        values = np.arange(lower, upper + 1)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, offsets=values, thresholds=values, **surfaces)
+        os.replace(tmp_path, os.path.join(self.directory, 'surface.npz'))
+
+def evaluate(landscape, scenario, points, executor):
+    # Simulates the pairs the landscape does not have yet; returns how many
+    pending = [point for point in dict.fromkeys(points) if point not in landscape.points]
+    futures = {executor.submit(run_simulation, scenario_simulation(scenario, point)): point for point in pending}
+    for future in as_completed(futures):
+        landscape.add(futures[future], future.result())
+    return len(pending)
+
+def refined_cells(landscape, values, refine_fraction, top):
+    # The cells between neighbouring values to scan at the next step
+    cells = []
+    for offset0, offset1 in zip(values, values[1:]):
+        for threshold0, threshold1 in zip(values, values[1:]):
+            corners = [landscape.reward(point) for point in
+                       ((offset0, threshold0), (offset0, threshold1), (offset1, threshold0), (offset1, threshold1))]
+            if None in corners:
+                continue
+            cells.append((max(corners) - min(corners), max(corners), (offset0, offset1, threshold0, threshold1)))
+    steepest = sorted(cells, key=lambda cell: cell[0], reverse=True)[:int(np.ceil(refine_fraction * len(cells)))]
+    best = sorted(cells, key=lambda cell: cell[1], reverse=True)[:top]
+    return set(cell[2] for cell in steepest + best)
+
+def scan(landscape, scenario, executor, lower, upper, coarse_step, refine_fraction, top):
+    step = coarse_step
+    points = [(offset, threshold) for offset in axis(lower, upper, step) for threshold in axis(lower, upper, step)]
+    while True:
+        start_time = time.perf_counter()
+        simulated = evaluate(landscape, scenario, points, executor)
+        landscape.save(lower, upper)
+        best = max(landscape.points.values(), key=lambda record: record['reward'])
+        print('{0}: step = {1}: simulated = {2}: known = {3}: seconds = {4:.1f}: best = ({5}, {6}) reward = {7}'.format(
+            scenario['name'], step, simulated, len(landscape.points), time.perf_counter() - start_time,
+            best['offset'], best['threshold'], best['reward']))
+        if step == 1:
+            break
+        cells = refined_cells(landscape, axis(lower, upper, step), refine_fraction, top)
+        step = max(1, step // 2)
+        points = [(offset, threshold)
+                  for offset0, offset1, threshold0, threshold1 in sorted(cells)
+                  for offset in axis(offset0, offset1, step)
+                  for threshold in axis(threshold0, threshold1, step)]
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Scan the reward surface of scenarios over the integer actions')
+    arg_parser.add_argument('--scenarios', help='JSON list of scenarios, else gp.eval_scenarios and gp.eval_grid')
+    arg_parser.add_argument('--names', nargs='+', help='Scan only the scenarios with these names')
+    arg_parser.add_argument('--output', default=gp.landscape_dir, help='Directory of the landscapes')
+    arg_parser.add_argument('--coarse_step', type=int, default=8, help='Step of the first round; 1 scans every pair')
+    arg_parser.add_argument('--refine_fraction', type=float, default=0.25,
+                            help='Fraction of the cells with the largest reward range scanned at the next step')
+    arg_parser.add_argument('--top', type=int, default=3, help='Cells with the best rewards scanned at the next step')
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Simulator processes')
+    args = arg_parser.parse_args()
+
+    if args.scenarios:
+        with open(args.scenarios, 'r') as f:
+            scenarios = json.load(f)
+    else:
+        scenarios = list(gp.eval_scenarios) + (expand_grid(gp.eval_grid) if gp.eval_grid else [])
+    scenarios = [complete_scenario(scenario) for scenario in scenarios]
+    if args.names:
+        scenarios = [scenario for scenario in scenarios if scenario['name'] in args.names]
+
+    executor = create_pool(args.workers)
+    try:
+        for scenario in scenarios:
+            landscape = Landscape(os.path.join(args.output, scenario['name']), scenario)
+            scan(landscape, scenario, executor, gp.lower_limit, gp.upper_limit,
+                 args.coarse_step, args.refine_fraction, args.top)
+    finally:
+        executor.shutdown(wait=True)
+        close_sinks()
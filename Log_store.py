@@ -0,0 +1,354 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import json
+import math
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
+
+from Global_parameters import gp
+
+# Columnar store of the training logs, kept up to date by tailing them.
+#
+# update() reads what was appended to a log since the last call, both the
+# JSON lines the metric sinks write (logFile.jsonl, qualityValues.jsonl,
+# stageStats.jsonl) and the older 'key = value: key = value' text lines
+# (logFile.txt, qualityValues.txt). Every record goes to a stream: its
+# 'record' field ('train', 'eval', 'eval2'), else the name of the log it came
+# from. The numbers in a record become columns; lists become 2-d columns and
+# nested dictionaries dotted names ('eval_results.AverageReturn'). Text is
+# left out.
+#
+# A stream is a run of chunks of at most chunk_rows rows, one .npy file per
+# column and chunk, and manifest.json records the rows and the step range of
+# every chunk. The column files of a chunk are created at its full size, so an
+# update writes its rows in place through memory maps instead of rewriting the
+# chunk, and the rows only count once the manifest is saved.
+# query() reads only the chunks a step range touches, memory mapped, so a
+# dashboard loads one series of a long run without parsing the logs again.
+# The step of a record is its first field out of STEP_KEYS, or its position in
+# the stream for records without one (the quality log).
+
+STEP_KEYS = ['step', 'eval_step', 'eval2_step']
+
+LEGACY_FIELD = re.compile(r':\s*(?=[A-Za-z_][A-Za-z0-9_]*\s+= )')
+NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|[-+]?inf|nan')
+
+def parse_legacy_value(text):
+    text = text.strip()
+    if text.startswith('['):
+        return [float(number) for number in NUMBER.findall(text)]
+    if ' = ' in text:
+        # The 'name = value, name = value' summary of the eval metrics
+        values = {}
+        for pair in text.split(', '):
+            key, sep, value = pair.partition(' = ')
+            value = parse_legacy_value(value) if sep else None
+            if value is not None:
+                values[key.strip()] = value
+        return values or None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def parse_legacy_line(line):
+    # One 'key = value: key = value' line of the logs main.py and
+    # Environment_parser wrote before the metric sinks
+    record = {}
+    for field in LEGACY_FIELD.split(line.strip()):
+        key, sep, value = field.partition(' = ')
+        if not sep:
+            continue
+        value = parse_legacy_value(value)
+        if value is not None:
+            record[key.strip()] = value
+    for stream, key in (('train', 'step'), ('eval', 'eval_step'), ('eval2', 'eval2_step')):
+        if key in record:
+            record['record'] = stream
+    return record
+
+def flatten(record, prefix='', columns=None):
+    # Numeric fields of a record as name -> float or list of floats
+    if columns is None:
+        columns = {}
+    for key, value in record.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            flatten(value, name + '.', columns)
+        elif isinstance(value, (bool, int, float)):
+            columns[name] = float(value)
+        elif isinstance(value, list):
+            if value and all(isinstance(item, dict) for item in value):
+                for index, item in enumerate(value):
+                    flatten(item, '{}.{}.'.format(name, index), columns)
+            else:
+                values = np.asarray(value, dtype=object).ravel()
+                if all(isinstance(item, (bool, int, float)) for item in values):
+                    columns[name] = [float(item) for item in values]
+    return columns
+
+def to_columns(rows, steps):
+    # Rows of flattened records as arrays; a row without a column or with a
+    # shorter list is padded with NaN
+    widths = {}
+    for row in rows:
+        for name, value in row.items():
+            width = len(value) if isinstance(value, list) else 0
+            widths[name] = max(widths.get(name, 0), width)
+    columns = {'step': np.asarray(steps, dtype=np.int64)}
+    for name, width in widths.items():
+        array = np.full((len(rows), width) if width else len(rows), np.nan)
+        for index, row in enumerate(rows):
+            value = row.get(name)
+            if value is None:
+                continue
+            if width:
+                value = np.atleast_1d(value)
+                array[index, :len(value)] = value
+            elif not isinstance(value, list):
+                array[index] = value
+        columns[name] = array
+    return columns
+
+def pad(array, rows, width):
+    # array reshaped to `width` columns (0 for a 1-d column), or NaN when the
+    # chunk has no such column
+    if array is None:
+        return np.full((rows, width) if width else rows, np.nan)
+    if width and array.ndim == 1:
+        array = array[:, None]
+    if width and array.shape[1] < width:
+        array = np.concatenate([array, np.full((rows, width - array.shape[1]), np.nan)], axis=1)
+    return array
+
+def column_width(array):
+    return array.shape[1] if array.ndim == 2 else 0
+
+def open_column(path, rows, capacity, width, dtype, keep=True):
+    # The column file of a chunk as a writable memory map of capacity rows
+    # and at least width columns, NaN (0 for the steps) past the first rows.
+    # Chunk files are created at full size, so appending writes the new rows
+    # in place; a file too small for them, or not to be kept, is replaced
+    # once, atomically, with rows copied over from it
+    shape = (capacity, width) if width else (capacity,)
+    old = None
+    if keep and os.path.exists(path):
+        array = np.load(path, mmap_mode='r+')
+        if array.shape[0] >= capacity and column_width(array) >= width and (width or array.ndim == 1):
+            return array
+        old = pad(np.array(array[:rows]), rows, width)
+        del array
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=shape)
+        array[...] = 0 if np.issubdtype(dtype, np.integer) else np.nan
+        if old is not None:
+            array[:rows] = old
+        array.flush()
+        del array
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return np.load(path, mmap_mode='r+')
+
+class LogStore:
+    def __init__(self, directory, chunk_rows=10000):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = {'sources': {}, 'streams': {}}
+        self.reload()
+
+    def reload(self):
+        # Picks up what another process added since, for long lived readers
+        if os.path.exists(self.manifest_path()):
+            with open(self.manifest_path(), 'r') as f:
+                self.manifest = json.load(f)
+
+    def manifest_path(self):
+        return os.path.join(self.directory, 'manifest.json')
+
+    def chunk_path(self, stream, name, chunk):
+        return os.path.join(self.directory, stream, '{}.{:06d}.npy'.format(name, chunk))
+
+    def save_manifest(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path())
+
+    def update(self, file_name):
+        # Adds the complete lines appended to file_name since the last update
+        # and returns how many records that was. A log that was truncated or
+        # replaced is read again from its start.
+        source = self.manifest['sources'].setdefault(os.path.abspath(file_name), {'offset': 0, 'inode': None})
+        if not os.path.exists(file_name):
+            return 0
+        stat = os.stat(file_name)
+        if source['inode'] != stat.st_ino or stat.st_size < source['offset']:
+            source['offset'] = 0
+            source['inode'] = stat.st_ino
+        with open(file_name, 'rb') as f:
+            f.seek(source['offset'])
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return 0
+        source['offset'] += end
+
+        default_stream = os.path.splitext(os.path.basename(file_name))[0]
+        records = {}
+        for line in data[:end].decode('utf-8', errors='replace').splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+            else:
+                record = parse_legacy_line(line)
+            if not record:
+                continue
+            stream = str(record.pop('record', default_stream))
+            records.setdefault(stream, []).append(record)
+        count = 0
+        for stream, stream_records in records.items():
+            self.append(stream, stream_records)
+            count += len(stream_records)
+        self.save_manifest()
+        return count
+
+    def append(self, stream, records):
+        info = self.manifest['streams'].setdefault(stream, {'rows': 0, 'chunks': []})
+        rows, steps = [], []
+        for record in records:
+            step = next((record[key] for key in STEP_KEYS if key in record), None)
+            steps.append(info['rows'] + len(steps) if step is None else int(step))
+            rows.append(flatten({key: value for key, value in record.items() if key not in STEP_KEYS}))
+        columns = to_columns(rows, steps)
+        os.makedirs(os.path.join(self.directory, stream), exist_ok=True)
+
+        # The last chunk is filled up before a new one is started
+        chunks = info['chunks']
+        total = len(columns['step'])
+        start = 0
+        while start < total:
+            if not chunks or chunks[-1]['rows'] >= self.chunk_rows:
+                chunks.append({'id': chunks[-1]['id'] + 1 if chunks else 0, 'rows': 0, 'first_step': None,
+                               'last_step': None, 'sorted': True, 'columns': {}})
+            count = min(self.chunk_rows - chunks[-1]['rows'], total - start)
+            self.write_chunk(stream, chunks[-1], {name: array[start:start + count] for name, array in columns.items()})
+            start += count
+        info['rows'] += len(records)
+
+    def write_chunk(self, stream, chunk, part):
+        # Writes the rows of part after the chunk's own, in place. The
+        # manifest only counts them once it is saved, so a reader never sees
+        # rows half written
+        rows = chunk['rows']
+        count = len(part['step'])
+        previous_step = None
+        for name in list(part) + [name for name in chunk['columns'] if name not in part]:
+            values = part.get(name)
+            width = max(chunk['columns'].get(name, 0), 0 if values is None else column_width(values))
+            array = open_column(self.chunk_path(stream, name, chunk['id']), rows, self.chunk_rows, width,
+                                np.int64 if name == 'step' else np.float64, keep=name in chunk['columns'])
+            if name == 'step' and rows:
+                previous_step = int(array[rows - 1])
+            # A column the new rows do not have still gets NaN there, over
+            # whatever an interrupted write left
+            array[rows:rows + count] = pad(values, count, width)
+            array.flush()
+            del array
+            chunk['columns'][name] = width
+        steps = part['step']
+        chunk['first_step'] = int(steps.min()) if rows == 0 else min(chunk['first_step'], int(steps.min()))
+        chunk['last_step'] = int(steps.max()) if rows == 0 else max(chunk['last_step'], int(steps.max()))
+        # A resumed run repeats the steps after its checkpoint
+        chunk['sorted'] = bool(chunk['sorted'] and np.all(steps[1:] >= steps[:-1]) and
+                               (previous_step is None or steps[0] >= previous_step))
+        chunk['rows'] = rows + count
+
+    def read_chunk(self, stream, chunk, names=None, mmap_mode=None):
+        names = chunk['columns'] if names is None else names
+        return {name: np.load(self.chunk_path(stream, name, chunk['id']), mmap_mode=mmap_mode)[:chunk['rows']]
+                for name in names if name in chunk['columns']}
+
+    def streams(self):
+        return {stream: info['rows'] for stream, info in self.manifest['streams'].items()}
+
+    def columns(self, stream):
+        widths = {}
+        for chunk in self.manifest['streams'][stream]['chunks']:
+            for name, width in chunk['columns'].items():
+                widths[name] = max(widths.get(name, 0), width)
+        return widths
+
+    def query(self, stream, names=None, start=None, stop=None):
+        # Columns of the rows with start <= step < stop, with the steps under
+        # 'step'. Only the chunks overlapping the range are read, through
+        # memory maps; a column missing from a chunk reads as NaN.
+        widths = self.columns(stream)
+        names = list(widths) if names is None else ['step'] + [name for name in names if name != 'step']
+        low = -math.inf if start is None else start
+        high = math.inf if stop is None else stop
+        parts = {name: [] for name in names}
+        for chunk in self.manifest['streams'][stream]['chunks']:
+            if chunk['last_step'] < low or chunk['first_step'] >= high:
+                continue
+            arrays = self.read_chunk(stream, chunk, names, mmap_mode='r')
+            steps = arrays['step']
+            if chunk['sorted']:
+                selection = slice(np.searchsorted(steps, low, 'left'), np.searchsorted(steps, high, 'left'))
+                rows = selection.stop - selection.start
+            else:
+                selection = (steps >= low) & (steps < high)
+                rows = int(selection.sum())
+            for name in names:
+                array = arrays.get(name)
+                parts[name].append(pad(None if array is None else array[selection], rows, widths.get(name, 0)))
+        return {name: np.concatenate(arrays) if arrays else np.empty(0) for name, arrays in parts.items()}
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Tail the training logs into a columnar store and query it')
+    arg_parser.add_argument('logs', nargs='*', default=[gp.file_name, gp.rsrq_throughput_file],
+                            help='Logs to tail, JSON lines or the old text format')
+    arg_parser.add_argument('--store', default=gp.log_store_dir, help='Directory of the store')
+    arg_parser.add_argument('--chunk_rows', type=int, default=gp.log_store_chunk, help='Rows per chunk')
+    arg_parser.add_argument('--follow', action='store_true', help='Keep tailing the logs')
+    arg_parser.add_argument('--interval', type=float, default=5.0, help='Seconds between updates with --follow')
+    arg_parser.add_argument('--query', nargs='+', metavar=('STREAM', 'COLUMN'), help='Print columns of a stream')
+    arg_parser.add_argument('--start', type=int, help='First step of --query')
+    arg_parser.add_argument('--stop', type=int, help='Step after the last one of --query')
+    args = arg_parser.parse_args()
+
+    store = LogStore(args.store, args.chunk_rows)
+    if args.query:
+        start_time = time.perf_counter()
+        result = store.query(args.query[0], args.query[1:] or None, args.start, args.stop)
+        elapsed = time.perf_counter() - start_time
+        for index in range(len(result['step'])):
+            print(' '.join('{} = {}'.format(name, np.round(values[index], 6).tolist()) for name, values in result.items()))
+        print('rows = {0}: seconds = {1:.4f}'.format(len(result['step']), elapsed))
+    else:
+        while True:
+            for file_name in args.logs:
+                added = store.update(file_name)
+                if added:
+                    print('{0}: {1} records'.format(file_name, added))
+            if not args.follow:
+                break
+            time.sleep(args.interval)
+        for stream, rows in store.streams().items():
+            print('{0}: rows = {1}: columns = {2}'.format(stream, rows, ', '.join(store.columns(stream))))
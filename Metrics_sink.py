@@ -0,0 +1,134 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import atexit
+import csv
+import io
+import json
+import os
+import threading
+
+# Buffered, append-only writer of metric records. Records are dictionaries,
+# encoded as one JSON object per line for '.jsonl' files or one row per record
+# for '.csv' files, and written in batches of flush_interval records. The
+# records of a CSV sink go to one file per record type, name_<record>.csv by
+# their 'record' value or the file itself without one, each with the header of
+# its first record; a record with a column its file has no header for is
+# rejected instead of silently losing the value. Every file has one sink
+# shared by the whole process (get_sink), and all sinks are flushed and closed
+# when the process exits. A forked child starts without sinks, so it never
+# writes the records its parent buffered.
+
+class MetricsSink:
+    def __init__(self, file_name, flush_interval=100):
+        self.file_name = file_name
+        self.flush_interval = flush_interval
+        self.csv = file_name.endswith('.csv')
+        # Open file and CSV columns by path
+        self.files = {}
+        self.columns = {}
+        self.buffer = []
+        self.lock = threading.Lock()
+        directory = os.path.dirname(file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not self.csv:
+            self.files[file_name] = open(file_name, 'a')
+        self.closed = False
+
+    def write(self, record):
+        # Records are encoded right away, so later changes to the lists and
+        # arrays they refer to do not leak into the log
+        with self.lock:
+            if self.csv:
+                path = self.csv_path(record)
+                self.buffer.append((path, self._csv_row(path, record)))
+            else:
+                self.buffer.append((self.file_name, json.dumps(record, default=to_json) + '\n'))
+            if len(self.buffer) >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.buffer or self.closed:
+            return
+        for path in dict.fromkeys(path for path, _ in self.buffer):
+            if path not in self.files:
+                self.files[path] = open(path, 'a', newline='')
+            self.files[path].write(''.join(text for text_path, text in self.buffer if text_path == path))
+            self.files[path].flush()
+        self.buffer = []
+
+    def csv_path(self, record):
+        kind = record.get('record')
+        if kind is None:
+            return self.file_name
+        base, extension = os.path.splitext(self.file_name)
+        return '{}_{}{}'.format(base, kind, extension)
+
+    def _csv_row(self, path, record):
+        output = io.StringIO()
+        writer = csv.writer(output)
+        columns = self.columns.get(path)
+        if columns is None:
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                with open(path, 'r', newline='') as f:
+                    columns = next(csv.reader(f))
+            else:
+                columns = list(record.keys())
+                writer.writerow(columns)
+            self.columns[path] = columns
+        extra = [column for column in record if column not in columns]
+        if extra:
+            raise ValueError('{} has no columns for {} of record {}'.format(path, extra, record))
+        writer.writerow([csv_value(record.get(column)) for column in columns])
+        return output.getvalue()
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            for f in self.files.values():
+                f.close()
+            self.files = {}
+            self.closed = True
+
+def to_json(value):
+    # NumPy arrays and scalars, and eager tensors through their numpy() value
+    if hasattr(value, 'numpy'):
+        value = value.numpy()
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+def csv_value(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return json.dumps(value, default=to_json)
+
+sinks = {}
+sinks_lock = threading.Lock()
+
+def get_sink(file_name, flush_interval=100):
+    with sinks_lock:
+        if file_name not in sinks:
+            sinks[file_name] = MetricsSink(file_name, flush_interval)
+        return sinks[file_name]
+
+def close_sinks():
+    with sinks_lock:
+        for sink in sinks.values():
+            sink.close()
+        sinks.clear()
+
+def discard_sinks():
+    # The parent writes the buffered records of these sinks itself
+    global sinks_lock
+    sinks_lock = threading.Lock()
+    sinks.clear()
+
+atexit.register(close_sinks)
+os.register_at_fork(after_in_child=discard_sinks)
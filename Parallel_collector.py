@@ -0,0 +1,86 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from tf_agents.metrics import py_metrics
+
+# Runs one tf_agents Actor per HandoverEnv worker at the same time. Every
+# worker environment launches its own ./simulator child process and the
+# worker threads spend almost all of their time waiting on it with the GIL
+# released, so N workers keep N cores busy with ns-3 runs. Each actor owns its
+# own Reverb writer, so trajectories of different workers are never
+# interleaved into the same replay sequence.
+
+class CombinedMetric:
+    # One collect metric over all workers: the counters (episodes, steps) add
+    # up, the averages (return, episode length) are averaged
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.name = metrics[0].name
+        self.counter = isinstance(metrics[0], py_metrics.CounterMetric)
+
+    def result(self):
+        results = [metric.result() for metric in self.metrics]
+        return np.sum(results) if self.counter else np.mean(results)
+
+class ParallelCollector:
+    def __init__(self, actors):
+        self.actors = actors
+        self.executor = ThreadPoolExecutor(max_workers=len(actors), thread_name_prefix='collector')
+
+    @property
+    def metrics(self):
+        return [CombinedMetric(list(metrics)) for metrics in zip(*(actor.metrics for actor in self.actors))]
+
+    def run(self):
+        # One run() collects one trajectory from every worker
+        futures = [self.executor.submit(collector.run) for collector in self.actors]
+        for future in futures:
+            future.result()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+class PipelinedCollector:
+    # Collects the next episode in a background thread while the learner
+    # trains, so the simulator and the learner step overlap. The collectors
+    # act with a snapshot of the collect policy (Evaluation_service's
+    # PolicySnapshot), which start() refreshes from the live policy once it
+    # is max_staleness train steps old. The refresh only happens between
+    # wait() and the next start(), when no episode is in flight.
+    def __init__(self, collector, snapshot, max_staleness=1):
+        self.collector = collector
+        self.snapshot = snapshot
+        self.max_staleness = max_staleness
+        self.snapshot_step = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pipelined_collector')
+        self.future = None
+
+    @property
+    def metrics(self):
+        return self.collector.metrics
+
+    def start(self, step):
+        self.wait()
+        if self.snapshot_step is None or step - self.snapshot_step >= self.max_staleness:
+            self.snapshot.update()
+            self.snapshot_step = step
+        self.future = self.executor.submit(self.collector.run)
+
+    def wait(self):
+        if self.future is not None:
+            future, self.future = self.future, None
+            future.result()
+
+    def run(self):
+        # Collects in the foreground, e.g. the initial collect
+        self.wait()
+        self.collector.run()
+
+    def close(self):
+        self.wait()
+        self.executor.shutdown(wait=True)
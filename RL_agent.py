@@ -1,174 +1,331 @@
-from __future__ import absolute_import
-from __future__ import division
-from __future__ import print_function
-
-import os
-import reverb
-import tensorflow as tf
-
-from tf_agents.agents.ddpg import critic_network
-from tf_agents.agents.sac import sac_agent
-from tf_agents.agents.sac import tanh_normal_projection_network
-from tf_agents.metrics import py_metrics
-from tf_agents.networks import actor_distribution_network
-from tf_agents.policies import py_tf_eager_policy
-from tf_agents.policies import random_py_policy
-from tf_agents.replay_buffers import reverb_replay_buffer
-from tf_agents.replay_buffers import reverb_utils
-from tf_agents.train import actor
-from tf_agents.train import learner
-from tf_agents.train import triggers
-from tf_agents.train.utils import spec_utils
-from tf_agents.train.utils import strategy_utils
-from tf_agents.train.utils import train_utils
-
-
-from tensorflow.python.ops.numpy_ops import np_config
-np_config.enable_numpy_behavior()
-
-from Global_parameters import gp
-from RL_environment import HandoverEnv
-
-checkingdir = '/tmp'
-
-class RL_agent:
-  
-    def __init__(self):        
-        self.collect_env = HandoverEnv()
-        self.eval_env = HandoverEnv(eval1=True)
-        self.eval_env2 = HandoverEnv(eval2=True)
-        self.strategy = strategy_utils.get_strategy(tpu=False, use_gpu=False)
-        self.create_RL_agent()
-        self.replay_buffer_creator()
-        self.collector_evaluator_creator()
-        self.learner_creator()
-
-    def create_RL_agent(self):
-        observation_spec, action_spec, time_step_spec = (
-            spec_utils.get_tensor_specs(self.collect_env))
-
-        with self.strategy.scope():
-            self.critic_net = critic_network.CriticNetwork(
-                    (observation_spec, action_spec),
-                    observation_fc_layer_params=None,
-                    action_fc_layer_params=None,
-                    joint_fc_layer_params=gp.critic_joint_fc_layer_params,
-                    kernel_initializer='glorot_uniform',
-                    last_kernel_initializer='glorot_uniform')
-
-        with self.strategy.scope():
-            self.actor_net = actor_distribution_network.ActorDistributionNetwork(
-                observation_spec,
-                action_spec,
-                fc_layer_params=gp.actor_fc_layer_params,
-                continuous_projection_net=(
-                    tanh_normal_projection_network.TanhNormalProjectionNetwork))
-        
-        with self.strategy.scope():
-            self.train_step = train_utils.create_train_step()
-            self.tf_agent = sac_agent.SacAgent(
-                    time_step_spec,
-                    action_spec,
-                    actor_network=self.actor_net,
-                    critic_network=self.critic_net,
-                    actor_optimizer=tf.keras.optimizers.Adam(
-                        learning_rate=gp.actor_learning_rate),
-                    critic_optimizer=tf.keras.optimizers.Adam(
-                        learning_rate=gp.critic_learning_rate),
-                    alpha_optimizer=tf.keras.optimizers.Adam(
-                        learning_rate=gp.alpha_learning_rate),
-                    target_update_tau=gp.target_update_tau,
-                    target_update_period=gp.target_update_period,
-                    td_errors_loss_fn=tf.math.squared_difference,
-                    gamma=gp.gamma,
-                    reward_scale_factor=gp.reward_scale_factor,
-                    train_step_counter=self.train_step,
-                    debug_summaries = True,
-                    summarize_grads_and_vars = True,
-            )
-            self.tf_agent.initialize()
-
-    def replay_buffer_creator(self):
-        table_name = 'uniform_table'
-        table = reverb.Table(
-            table_name,
-            max_size=gp.replay_buffer_capacity,
-            sampler=reverb.selectors.Uniform(),
-            remover=reverb.selectors.Fifo(),
-            rate_limiter=reverb.rate_limiters.MinSize(1))
-
-        reverb_server = reverb.Server([table])
-
-        reverb_replay = reverb_replay_buffer.ReverbReplayBuffer(
-            self.tf_agent.collect_data_spec,
-            sequence_length=2,
-            table_name=table_name,
-            local_server=reverb_server)
-
-        dataset = reverb_replay.as_dataset(
-            sample_batch_size=gp.batch_size, num_steps=2, num_parallel_calls=5).prefetch(50)
-        self.experience_dataset_fn = lambda: dataset
-
-        self.observer = reverb_utils.ReverbAddTrajectoryObserver(
-        reverb_replay.py_client,
-        table_name,
-        sequence_length=2,
-        stride_length=1)
-
-    def collector_evaluator_creator(self):
-        self.tf_target_policy = self.tf_agent.policy
-        self.target_policy = py_tf_eager_policy.PyTFEagerPolicy(
-        self.tf_target_policy, use_tf_function=True)
-
-        self.tf_collect_policy = self.tf_agent.collect_policy
-        self.collect_policy = py_tf_eager_policy.PyTFEagerPolicy(
-        self.tf_collect_policy, use_tf_function=True)
-
-        env_step_metric = py_metrics.EnvironmentSteps()
-        self.collector = actor.Actor(
-        self.collect_env,
-        self.collect_policy,
-        self.train_step,
-        steps_per_run=1,
-        metrics=actor.collect_metrics(10),
-        summary_dir=os.path.join(checkingdir, learner.TRAIN_DIR),
-        observers=[self.observer, env_step_metric])
-        self.collector.run()
-
-        self.evaluator = actor.Actor(
-        self.eval_env,
-        self.target_policy,
-        self.train_step,
-        steps_per_run=1,
-        metrics=actor.eval_metrics(1),
-        summary_dir=os.path.join(checkingdir, 'eval'),
-        )
-
-        self.evaluator2 = actor.Actor(
-        self.eval_env2,
-        self.target_policy,
-        self.train_step,
-        steps_per_run=1,
-        metrics=actor.eval_metrics(1),
-        summary_dir=os.path.join(checkingdir, 'eval2'),
-        )
-
-    def learner_creator(self):
-        saved_model_dir = os.path.join(checkingdir, learner.POLICY_SAVED_MODEL_DIR)
-
-        learning_triggers = [
-            triggers.PolicySavedModelTrigger(
-                saved_model_dir,
-                self.tf_agent,
-                self.train_step,
-                interval=gp.policy_save_interval),
-            triggers.StepPerSecondLogTrigger(self.train_step, interval=1000),
-        ]
-
-        self.agent_learner = learner.Learner(
-        checkingdir,
-        self.train_step,
-        self.tf_agent,
-        self.experience_dataset_fn,
-        triggers=learning_triggers,
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import reverb
+import tensorflow as tf
+
+from tf_agents.agents.ddpg import critic_network
+from tf_agents.agents.sac import sac_agent
+from tf_agents.agents.sac import tanh_normal_projection_network
+from tf_agents.metrics import py_metrics
+from tf_agents.networks import actor_distribution_network
+from tf_agents.policies import actor_policy
+from tf_agents.policies import py_policy
+from tf_agents.policies import py_tf_eager_policy
+from tf_agents.policies import random_py_policy
+from tf_agents.replay_buffers import reverb_replay_buffer
+from tf_agents.replay_buffers import reverb_utils
+from tf_agents.trajectories import time_step as ts
+from tf_agents.train import actor
+from tf_agents.train import learner
+from tf_agents.train import triggers
+from tf_agents.train.utils import spec_utils
+from tf_agents.train.utils import strategy_utils
+from tf_agents.train.utils import train_utils
+from tf_agents.utils import common
+
+
+from tensorflow.python.ops.numpy_ops import np_config
+np_config.enable_numpy_behavior()
+
+from Global_parameters import gp
+from RL_environment import HandoverEnv
+from Parallel_collector import ParallelCollector, PipelinedCollector
+from Evaluation_service import PolicySnapshot
+from Evaluation_suite import EvaluationSuite, expand_grid
+from Stage_profiler import profiler
+from Training_checkpoint import TrainingCheckpointer, new_table_directory, resume_table
+from Episode_archive import warm_start
+from Surrogate_model import SurrogateModel
+from Fidelity_scheduler import FidelityScheduler
+from Scenario_scheduler import ScenarioScheduler
+
+checkingdir = '/tmp'
+
+REPLAY_TABLE = 'uniform_table'
+
+def create_sac_agent(strategy, env):
+    # The SAC agent with its networks for the specs of env, shared by
+    # RL_agent and the processes of Distributed_training
+    observation_spec, action_spec, time_step_spec = (
+        spec_utils.get_tensor_specs(env))
+
+    with strategy.scope():
+        critic_net = critic_network.CriticNetwork(
+                (observation_spec, action_spec),
+                observation_fc_layer_params=None,
+                action_fc_layer_params=None,
+                joint_fc_layer_params=gp.critic_joint_fc_layer_params,
+                kernel_initializer='glorot_uniform',
+                last_kernel_initializer='glorot_uniform')
+
+    with strategy.scope():
+        actor_net = actor_distribution_network.ActorDistributionNetwork(
+            observation_spec,
+            action_spec,
+            fc_layer_params=gp.actor_fc_layer_params,
+            continuous_projection_net=(
+                tanh_normal_projection_network.TanhNormalProjectionNetwork))
+
+    with strategy.scope():
+        train_step = train_utils.create_train_step()
+        tf_agent = sac_agent.SacAgent(
+                time_step_spec,
+                action_spec,
+                actor_network=actor_net,
+                critic_network=critic_net,
+                actor_optimizer=tf.keras.optimizers.Adam(
+                    learning_rate=gp.actor_learning_rate),
+                critic_optimizer=tf.keras.optimizers.Adam(
+                    learning_rate=gp.critic_learning_rate),
+                alpha_optimizer=tf.keras.optimizers.Adam(
+                    learning_rate=gp.alpha_learning_rate),
+                target_update_tau=gp.target_update_tau,
+                target_update_period=gp.target_update_period,
+                td_errors_loss_fn=tf.math.squared_difference,
+                gamma=gp.gamma,
+                reward_scale_factor=gp.reward_scale_factor,
+                train_step_counter=train_step,
+                debug_summaries = True,
+                summarize_grads_and_vars = True,
+        )
+        tf_agent.initialize()
+    return tf_agent, actor_net, critic_net, train_step
+
+def create_surrogate():
+    return SurrogateModel(gp.all_sate, members=gp.surrogate_members,
+                          min_samples=gp.surrogate_min_samples,
+                          max_uncertainty=gp.surrogate_max_uncertainty,
+                          max_error=gp.surrogate_max_error,
+                          audit_rate=gp.surrogate_audit_rate)
+
+def create_fidelity_scheduler():
+    return FidelityScheduler(gp.fidelity_durations, schedule=gp.fidelity_schedule,
+                             steps=gp.fidelity_steps,
+                             window=gp.fidelity_window,
+                             min_episodes=gp.fidelity_min_episodes,
+                             variance_threshold=gp.fidelity_variance_threshold)
+
+def create_scenario_scheduler():
+    # None when the scenarios are drawn at random
+    if gp.scenario_pool_file is None and gp.scenario_pool_size is None:
+        return None
+    return ScenarioScheduler(pool_size=gp.scenario_pool_size, seed=gp.scenario_pool_seed,
+                             pool_file=gp.scenario_pool_file)
+
+def create_replay_table(samples_per_insert=None):
+    # With samples_per_insert the learner can not take more gradient steps
+    # per collected transition than that allows, for learners that do not
+    # wait for the collection themselves (Distributed_training)
+    rate_limiter = reverb.rate_limiters.MinSize(1)
+    if samples_per_insert is not None:
+        rate_limiter = reverb.rate_limiters.SampleToInsertRatio(
+            samples_per_insert=samples_per_insert,
+            min_size_to_sample=gp.replay_min_size,
+            error_buffer=gp.samples_per_insert_error)
+    return reverb.Table(
+        REPLAY_TABLE,
+        max_size=gp.replay_buffer_capacity,
+        sampler=reverb.selectors.Uniform(),
+        remover=reverb.selectors.Fifo(),
+        rate_limiter=rate_limiter)
+
+def create_reverb_checkpointer():
+    # The server writes a table checkpoint to a directory of this run on
+    # every reverb_client.checkpoint(), and only a resumed run starts from
+    # the table checkpoint of the agent checkpoint it resumes from
+    if not gp.resume_training and not gp.checkpoint_interval:
+        return None
+    fallback = resume_table(gp.checkpoint_dir) if gp.resume_training else None
+    return reverb.checkpointers.DefaultCheckpointer(
+        path=new_table_directory(gp.checkpoint_dir), fallback_checkpoint_path=fallback)
+
+class TimedPyPolicy(py_policy.PyPolicy):
+    # Times every action() call of the wrapped policy as one profiler stage
+    def __init__(self, policy, stage):
+        super(TimedPyPolicy, self).__init__(
+            policy.time_step_spec, policy.action_spec, policy.policy_state_spec, policy.info_spec)
+        self._policy = policy
+        self._stage = stage
+
+    def _get_initial_state(self, batch_size):
+        return self._policy.get_initial_state(batch_size)
+
+    def _action(self, time_step, policy_state):
+        with profiler.stage(self._stage):
+            return self._policy.action(time_step, policy_state)
+
+class RL_agent:
+  
+    def __init__(self):        
+        self.collect_envs = [HandoverEnv(name='collect_{}'.format(worker)) for worker in range(gp.num_collect_workers)]
+        self.collect_env = self.collect_envs[0]
+        # One surrogate learns from all collect workers
+        self.surrogate = None
+        if gp.use_surrogate:
+            self.surrogate = create_surrogate()
+            for collect_env in self.collect_envs:
+                collect_env.surrogate = self.surrogate
+        # and one fidelity schedule runs them all; evaluation stays at full
+        # duration
+        self.fidelity = None
+        if gp.fidelity_schedule is not None:
+            self.fidelity = create_fidelity_scheduler()
+            for collect_env in self.collect_envs:
+                collect_env.fidelity = self.fidelity
+        self.scenarios = create_scenario_scheduler()
+        for collect_env in self.collect_envs:
+            collect_env.scenarios = self.scenarios
+        self.strategy = strategy_utils.get_strategy(tpu=False, use_gpu=False)
+        self.create_RL_agent()
+        self.replay_buffer_creator()
+        self.checkpointer = TrainingCheckpointer(
+            gp.checkpoint_dir, self.tf_agent, self.train_step, self.reverb_client,
+            self.collect_envs, fidelity=self.fidelity,
+            max_to_keep=gp.checkpoints_to_keep, async_checkpoint=gp.async_checkpoint)
+        self.resumed = gp.resume_training and self.checkpointer.restore()
+        self.warm_started = 0
+        if gp.warm_start_dir and not self.resumed:
+            self.warm_start_replay_buffer()
+        self.collector_evaluator_creator()
+        self.learner_creator()
+
+    def create_RL_agent(self):
+        self.tf_agent, self.actor_net, self.critic_net, self.train_step = create_sac_agent(
+            self.strategy, self.collect_env)
+
+    def replay_buffer_creator(self):
+        table_name = REPLAY_TABLE
+        self.reverb_server = reverb.Server([create_replay_table()], checkpointer=create_reverb_checkpointer())
+
+        reverb_replay = reverb_replay_buffer.ReverbReplayBuffer(
+            self.tf_agent.collect_data_spec,
+            sequence_length=2,
+            table_name=table_name,
+            local_server=self.reverb_server)
+        self.reverb_client = reverb_replay.py_client
+
+        dataset = reverb_replay.as_dataset(
+            sample_batch_size=gp.batch_size, num_steps=2, num_parallel_calls=5).prefetch(50)
+        self.experience_dataset_fn = lambda: dataset
+
+        # One observer per collect worker, each observer keeps its own writer
+        self.observers = [reverb_utils.ReverbAddTrajectoryObserver(
+        reverb_replay.py_client,
+        table_name,
+        sequence_length=2,
+        stride_length=1) for _ in self.collect_envs]
+        self.observer = self.observers[0]
+        self.table_name = table_name
+
+    def collector_evaluator_creator(self):
+        self.tf_target_policy = self.tf_agent.policy
+        self.target_policy = py_tf_eager_policy.PyTFEagerPolicy(
+        self.tf_target_policy, use_tf_function=True)
+
+        self.tf_collect_policy = self.tf_agent.collect_policy
+        self.collect_policy = py_tf_eager_policy.PyTFEagerPolicy(
+        self.tf_collect_policy, use_tf_function=True)
+        # Pipelined collectors act with a copy of the collect policy, so the
+        # learner can update the live one while an episode is simulating
+        self.collect_snapshot = None
+        if gp.pipelined_collection:
+            self.collect_snapshot = self.create_policy_snapshot()
+            self.collect_snapshot.update()
+            self.collect_policy = self.collect_snapshot.policy
+        if profiler.enabled:
+            self.collect_policy = TimedPyPolicy(self.collect_policy, 'policy_inference')
+
+        self.collectors = []
+        for worker, (collect_env, observer) in enumerate(zip(self.collect_envs, self.observers)):
+            summary_dir = os.path.join(checkingdir, learner.TRAIN_DIR)
+            if worker > 0:
+                summary_dir = os.path.join(summary_dir, 'worker_{}'.format(worker))
+            env_step_metric = py_metrics.EnvironmentSteps()
+            self.collectors.append(actor.Actor(
+            collect_env,
+            self.collect_policy,
+            self.train_step,
+            steps_per_run=1,
+            metrics=actor.collect_metrics(10),
+            summary_dir=summary_dir,
+            observers=[observer, env_step_metric]))
+
+        # With several workers one collector.run() takes one trajectory per worker
+        if len(self.collectors) > 1:
+            self.collector = ParallelCollector(self.collectors)
+        else:
+            self.collector = self.collectors[0]
+        self.pipeline = None
+        if gp.pipelined_collection:
+            self.pipeline = PipelinedCollector(self.collector, self.collect_snapshot, gp.max_policy_staleness)
+        # A resumed or warm started run already has trajectories in the table
+        if not self.resumed and not self.warm_started:
+            self.collector.run()
+
+        # The asynchronous evaluation acts with its own copy of the target
+        # policy, so the learner can keep updating the live one while it runs
+        self.eval_snapshot = None
+        eval_policy = self.target_policy
+        if gp.async_evaluation:
+            self.eval_snapshot = self.create_policy_snapshot()
+            eval_policy = self.eval_snapshot.policy
+
+        eval_scenarios = list(gp.eval_scenarios)
+        if gp.eval_grid:
+            eval_scenarios += expand_grid(gp.eval_grid)
+        self.evaluation_suite = EvaluationSuite(
+            eval_scenarios, lambda observation: eval_policy.action(ts.restart(observation)).action,
+            workers=gp.eval_workers)
+
+    def warm_start_replay_buffer(self):
+        # The archived transitions are written through an observer of their
+        # own, so the collectors' observers start with empty caches
+        observer = reverb_utils.ReverbAddTrajectoryObserver(
+        self.reverb_client,
+        self.table_name,
+        sequence_length=2,
+        stride_length=1)
+        self.warm_started = warm_start(observer, gp.warm_start_dir, gp.warm_start_filter,
+                                       observation_size=gp.all_sate, max_items=gp.replay_buffer_capacity)
+        print('Warm started the replay buffer with', self.warm_started, 'archived episodes')
+
+    def create_policy_snapshot(self):
+        observation_spec, action_spec, time_step_spec = (
+            spec_utils.get_tensor_specs(self.collect_env))
+
+        with self.strategy.scope():
+            actor_net = self.actor_net.copy(name='SnapshotActorNetwork')
+            actor_net.create_variables(observation_spec)
+            snapshot_step = tf.Variable(0, dtype=tf.int64, trainable=False, name='snapshot_step')
+        tf_policy = actor_policy.ActorPolicy(
+            time_step_spec, action_spec, actor_network=actor_net, training=False)
+        policy = py_tf_eager_policy.PyTFEagerPolicy(tf_policy, use_tf_function=True)
+
+        def update():
+            common.soft_variables_update(self.actor_net.variables, actor_net.variables, tau=1.0)
+            snapshot_step.assign(self.train_step)
+
+        return PolicySnapshot(policy, update, snapshot_step)
+
+    def learner_creator(self):
+        saved_model_dir = os.path.join(checkingdir, learner.POLICY_SAVED_MODEL_DIR)
+
+        learning_triggers = [
+            triggers.PolicySavedModelTrigger(
+                saved_model_dir,
+                self.tf_agent,
+                self.train_step,
+                interval=gp.policy_save_interval),
+            triggers.StepPerSecondLogTrigger(self.train_step, interval=1000),
+        ]
+
+        self.agent_learner = learner.Learner(
+        checkingdir,
+        self.train_step,
+        self.tf_agent,
+        self.experience_dataset_fn,
+        triggers=learning_triggers,
         strategy=self.strategy)
\ No newline at end of file
@@ -0,0 +1,81 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+# Per environment run state. Every environment records the results of its
+# episodes in its own EpisodeMetrics instead of the global parameters, so
+# environments can run side by side, and keeps the history of the per episode
+# numbers in fixed capacity ring buffers, so memory stays flat however long the
+# run is. The complete record of the last episode (action, reward, scenario and
+# the per cell values) is kept as is for logging.
+
+class RingBuffer:
+    def __init__(self, capacity, shape=(), dtype=np.float64):
+        self.buffer = np.zeros((capacity,) + tuple(shape), dtype=dtype)
+        self.capacity = capacity
+        # Number of values ever appended; the newest one is at (count-1) % capacity
+        self.count = 0
+
+    def append(self, value):
+        self.buffer[self.count % self.capacity] = value
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def values(self):
+        # Copy of the buffered values, oldest first
+        if self.count <= self.capacity:
+            return self.buffer[:self.count].copy()
+        start = self.count % self.capacity
+        return np.concatenate((self.buffer[start:], self.buffer[:start]))
+
+    def last(self):
+        if self.count == 0:
+            return None
+        return self.buffer[(self.count - 1) % self.capacity].copy()
+
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.buffer[:len(self)].mean(axis=0)
+
+    def clear(self):
+        self.count = 0
+
+class EpisodeMetrics:
+    def __init__(self, capacity, action_size=2):
+        self.actions = RingBuffer(capacity, (action_size,), np.float32)
+        self.rewards = RingBuffer(capacity)
+        self.throughputs = RingBuffer(capacity)
+        self.rsrqs = RingBuffer(capacity)
+        self.handovers = RingBuffer(capacity, dtype=np.int64)
+        self.episodes = 0
+        self.latest = None
+
+    def record(self, episode):
+        # episode holds the values of one finished episode, see
+        # HandoverEnv.episode_record
+        self.actions.append(episode['action'])
+        self.rewards.append(episode['reward'])
+        self.throughputs.append(sum(episode['throughput_to_save']))
+        self.rsrqs.append(sum(episode['rsrq_to_save']))
+        self.handovers.append(episode['handovers_count'])
+        self.episodes += 1
+        self.latest = episode
+
+    def summary(self):
+        # Means over the episodes still in the buffers
+        if self.episodes == 0:
+            return {'episodes': 0}
+        return {
+            'episodes': self.episodes,
+            'window': len(self.rewards),
+            'reward': float(self.rewards.mean()),
+            'throughput': float(self.throughputs.mean()),
+            'rsrq': float(self.rsrqs.mean()),
+            'handovers': float(self.handovers.mean()),
+            'action': self.actions.mean().tolist(),
+        }
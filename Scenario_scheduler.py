@@ -0,0 +1,112 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import random
+import threading
+
+from Global_parameters import gp
+
+# Scenarios of the training episodes from a fixed pool of (scenario, RngRun)
+# pairs instead of a fresh random draw for every episode. The pool is drawn
+# once from seed, with the distributions HandoverEnv draws from, or read from
+# a JSON list of scenarios, so every worker, actor and later run gets the same
+# pool. Episodes with the same pool entry see the same random numbers in the
+# simulator, so their rewards differ by the action only, and an action the
+# policy repeats on an entry is a hit in the simulation cache. pool_size
+# trades the diversity of the training scenarios against that reuse; the hit
+# rate of the simulated episodes shows where a pool stands.
+
+SCENARIO_KEYS = ['duration', 'UE_Count', 'min_speed', 'max_speed', 'x_pos', 'y_pos', 'rho', 'RngRun']
+
+# Values the training scenarios are drawn from
+DURATIONS = list(range(60, 91, 10))
+UE_COUNTS = [7, 8, 9]
+SPEEDS = [20, 40, 70]
+POSITIONS = list(range(0, 601, 100))
+RHO = 200
+
+def draw_scenario(rng):
+    speed = rng.choice(SPEEDS)
+    return {
+        'duration': rng.choice(DURATIONS),
+        'UE_Count': rng.choice(UE_COUNTS),
+        'min_speed': speed,
+        'max_speed': speed,
+        'x_pos': rng.choice(POSITIONS),
+        'y_pos': rng.choice(POSITIONS),
+        'rho': RHO,
+        'RngRun': rng.randint(0, 1000),
+    }
+
+def scenario_simulation(scenario, action, duration=None):
+    # The simulator inputs of an episode of scenario with action, simulating
+    # duration seconds of it (all of it by default); training and evaluation
+    # both build theirs here, so the same observation always runs the same
+    # simulation. The handover attributes are unsigned integers in the
+    # simulator, which truncates the float actions, so every action in
+    # [n, n+1) runs the same simulation; passing the integers makes that
+    # explicit and lets the cache key on the inputs the simulator really sees
+    return {
+        'NeighbourCellOffset': int(action[0]),
+        'ServingCellThreshold': int(action[1]),
+        'duration': scenario['duration'] if duration is None else duration,
+        'UE_Count': scenario['UE_Count'],
+        'ENB_Count': gp.ENB_Count,
+        'x_pos': scenario['x_pos'],
+        'rho': scenario['rho'],
+        'y_pos': scenario['y_pos'],
+        'max_speed': scenario['max_speed'],
+        'min_speed': scenario['min_speed'],
+        'RngRun': scenario['RngRun'],
+    }
+
+def load_pool(file_name):
+    with open(file_name) as f:
+        pool = json.load(f)
+    for scenario in pool:
+        missing = [key for key in SCENARIO_KEYS if key not in scenario]
+        if missing:
+            raise ValueError('Scenario {} in {} misses {}'.format(scenario, file_name, missing))
+    return pool
+
+class ScenarioScheduler:
+    def __init__(self, pool_size=100, seed=0, pool_file=None):
+        if pool_file is not None:
+            self.pool = load_pool(pool_file)
+        else:
+            pool_rng = random.Random(seed)
+            self.pool = [draw_scenario(pool_rng) for _ in range(pool_size)]
+        # Which entry the next episode gets is not seeded, so actors with the
+        # same pool do not simulate the same entries in lockstep
+        self.rng = random.Random()
+        self.draws = [0] * len(self.pool)
+        self.simulated = 0
+        self.cache_hits = 0
+        self.lock = threading.Lock()
+
+    def draw(self):
+        # Index and a copy of the scenario of the next episode
+        with self.lock:
+            index = self.rng.randrange(len(self.pool))
+            self.draws[index] += 1
+            return index, dict(self.pool[index])
+
+    def record(self, index, cache_hit):
+        # Called for every episode that was not imagined by the surrogate
+        with self.lock:
+            self.simulated += 1
+            if cache_hit:
+                self.cache_hits += 1
+
+    def summary(self):
+        with self.lock:
+            return {
+                'pool_size': len(self.pool),
+                'episodes': sum(self.draws),
+                'scenarios_used': sum(1 for draws in self.draws if draws),
+                'simulated': self.simulated,
+                'cache_hits': self.cache_hits,
+                'hit_rate': self.cache_hits / self.simulated if self.simulated else None,
+            }
@@ -0,0 +1,38 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import weakref
+
+# Private scratch directory of one environment for the files its simulations
+# write, so environments running side by side never share a trace file. The
+# directory lives in RAM (/dev/shm) where the host has it, else in the system
+# temporary directory, and is removed with everything in it when the
+# environment is closed, garbage collected or the process exits. archive()
+# copies a file out before that happens.
+
+def default_root():
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+class ScratchSpace:
+    def __init__(self, name, root=None):
+        self.directory = tempfile.mkdtemp(prefix='handover_{}_'.format(name), dir=root or default_root())
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, ignore_errors=True)
+
+    def path(self, file_name):
+        return os.path.join(self.directory, file_name)
+
+    def archive(self, file_name, destination):
+        directory = os.path.dirname(destination)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        shutil.copyfile(self.path(file_name), destination)
+        return destination
+
+    def cleanup(self):
+        self._finalizer()
@@ -0,0 +1,171 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import gzip
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+
+# On-disk cache of simulation results. An entry is keyed on the exact inputs
+# the simulator sees (integer handover parameters, scenario and RngRun), so a
+# hit is the result the ns-3 run would have produced. Every entry is a pickle
+# of the parsed episode result, optionally next to the gzip compressed trace.
+# The key also covers a version, CACHE_VERSION and the hash of the simulator
+# binary, so a rebuilt simulator or a change to what a result holds never
+# serves the results of the old one. Reading an entry refreshes its
+# modification time. The cache keeps the size of its directory in memory and
+# only scans it once that passes max_bytes, to remove the least recently used
+# entries down to evict_fraction of it. Caches of other processes sharing the
+# directory are seen at that scan, so the directory may run over until then.
+# The version of the last cache opened on a directory is kept in its
+# VERSION_FILE, so the replay backend finds the recorded traces on machines
+# without the simulator binary.
+
+# Bump when the parsing of a simulation, and so its cached result, changes
+CACHE_VERSION = 1
+VERSION_FILE = 'VERSION'
+
+def simulation_key(simulation, version=''):
+    text = version + json.dumps(simulation, sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+binary_hashes = {}
+
+def simulator_version(binary):
+    # CACHE_VERSION and the hash of the binary, by path, size and mtime
+    path = shutil.which(binary) or binary
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return '{}:'.format(CACHE_VERSION)
+    fingerprint = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if fingerprint not in binary_hashes:
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        binary_hashes[fingerprint] = digest.hexdigest()
+    return '{}:{}'.format(CACHE_VERSION, binary_hashes[fingerprint])
+
+def recorded_version(directory):
+    # Version of the cache last opened on directory, None without one
+    try:
+        with open(os.path.join(directory, VERSION_FILE), 'r') as f:
+            return f.read()
+    except OSError:
+        return None
+
+class SimulationCache:
+    def __init__(self, directory, max_bytes, version='', evict_fraction=0.9):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = version
+        self.evict_fraction = evict_fraction
+        # Bytes in the directory, known after the first scan
+        self.total = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        if recorded_version(directory) != version:
+            self.write_atomic(os.path.join(directory, VERSION_FILE), lambda f: f.write(version.encode('utf-8')))
+
+    def key(self, simulation):
+        return simulation_key(simulation, self.version)
+
+    def result_path(self, simulation):
+        return os.path.join(self.directory, self.key(simulation) + '.pkl')
+
+    def trace_path(self, simulation):
+        return os.path.join(self.directory, self.key(simulation) + '.trace.gz')
+
+    def get(self, simulation):
+        path = self.result_path(simulation)
+        try:
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return result
+
+    def put(self, simulation, result, trace_file=None):
+        added = 0
+        if trace_file is not None:
+            with open(trace_file, 'rb') as trace:
+                added += self.write_atomic(self.trace_path(simulation), lambda f: shutil.copyfileobj(trace, f),
+                                           compress=True)
+        added += self.write_atomic(self.result_path(simulation), lambda f: pickle.dump(result, f))
+        with self.lock:
+            if self.total is not None:
+                self.total += added
+            if self.total is None or self.total > self.max_bytes:
+                self.total = self.evict()
+
+    def write_atomic(self, path, write, compress=False):
+        # Concurrent environments may store the same entry, so every file is
+        # written next to its final name and moved into place in one step;
+        # returns the bytes it adds to the directory
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if compress:
+                    with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+                        write(gz)
+                else:
+                    write(f)
+                size = f.tell()
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return size - replaced
+
+    def evict(self):
+        # Scans the directory, removes the oldest entries past the budget and
+        # returns the bytes left
+        entries = {}
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tmp') or entry.name == VERSION_FILE:
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            key = entry.name.split('.', 1)[0]
+            size, mtime = entries.get(key, (0, 0))
+            # Result files are touched on every hit, so they date the entry
+            if entry.name.endswith('.pkl'):
+                mtime = stat.st_mtime
+            entries[key] = (size + stat.st_size, mtime)
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return total
+        for key, (size, mtime) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.evict_fraction * self.max_bytes:
+                break
+            for suffix in ('.pkl', '.trace.gz'):
+                try:
+                    os.unlink(os.path.join(self.directory, key + suffix))
+                except FileNotFoundError:
+                    pass
+            total -= size
+        return total
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -0,0 +1,180 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import gzip
+import os
+import subprocess
+import time
+
+from Global_parameters import gp
+from Simulation_cache import recorded_version, simulation_key, simulator_version
+from Stage_profiler import profiler
+from Trace_generator import generate_trace
+
+# Where the episode traces come from. A backend runs one simulation, given as
+# the dictionary of simulator arguments HandoverEnv builds, and parses its
+# trace into a datatracker.Data. NS3Backend runs the ns-3 binary; ReplayBackend
+# serves recorded traces keyed on the same arguments, or synthetic ones from
+# Trace_generator when there is no recording, after an artificial latency, so
+# the RL loop can be load-tested on machines without ns-3.
+
+def timed_lines(stream, waited, block_size=65536):
+    # The lines of stream, read in blocks; the wall time spent waiting for
+    # them is added to waited[0]
+    while True:
+        start = time.perf_counter()
+        block = stream.readlines(block_size)
+        waited[0] += time.perf_counter() - start
+        if not block:
+            return
+        yield from block
+
+def tee_lines(lines, output):
+    for line in lines:
+        output.write(line)
+        yield line
+
+class NS3Backend:
+    def __init__(self, env_parser, events_file_name, binary='./simulator'):
+        self.env_parser = env_parser
+        self.events_file_name = events_file_name
+        self.binary = binary
+
+    def arguments(self, simulation):
+        return [self.binary] + ["--{}={}".format(name, value) for name, value in simulation.items()]
+
+    def run(self, simulation, data, keep_trace=False):
+        # keep_trace asks for a copy of the trace in events_file_name. A
+        # simulator that fails or is killed raises CalledProcessError, so the
+        # partial trace it left never becomes a result
+        simulator_args = self.arguments(simulation)
+        if gp.stream_simulator_output:
+            self.stream_simulator(simulator_args, data, keep_trace)
+        elif not keep_trace and hasattr(os, 'memfd_create'):
+            # The trace goes to an anonymous in-memory file that disappears
+            # once it is parsed
+            with os.fdopen(os.memfd_create('simulator_trace'), 'w+') as trace:
+                with profiler.stage('simulator'):
+                    subprocess.run(simulator_args, stdout=trace, check=True)
+                trace.seek(0)
+                with profiler.stage('parse_document'):
+                    self.env_parser.parse_lines(data, trace)
+        else:
+            myoutput = open(self.events_file_name, 'w')
+            try:
+                with profiler.stage('simulator'):
+                    subprocess.run(simulator_args, stdout=myoutput, check=True)
+            finally:
+                myoutput.close() # close the file
+            with profiler.stage('parse_document'):
+                self.env_parser.parse_document(data, self.events_file_name)
+
+    def stream_simulator(self, simulator_args, data, tee=False):
+        # Parse the trace while the simulator is still writing it, so parsing
+        # overlaps with the simulation and nothing goes through the disk
+        # unless a copy of the trace is asked for. Both stages are wall time
+        # and add up to the run: 'parse_document' is the time in the parser
+        # less the waits for the simulator output, 'simulator' the rest
+        start = time.perf_counter()
+        process = subprocess.Popen(simulator_args, stdout=subprocess.PIPE, universal_newlines=True)
+        waited = [0.0]
+        lines = timed_lines(process.stdout, waited)
+        output = None
+        if tee:
+            output = open(self.events_file_name, 'w')
+            lines = tee_lines(lines, output)
+        parse_error = None
+        try:
+            parse_start = time.perf_counter()
+            self.env_parser.parse_lines(data, lines)
+            parse_seconds = time.perf_counter() - parse_start - waited[0]
+        except Exception as error:
+            parse_error = error
+        finally:
+            process.stdout.close()
+            process.wait()
+            if output is not None:
+                output.close()
+        # A trace cut off by a failed simulator shows as that failure
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, simulator_args) from parse_error
+        if parse_error is not None:
+            raise parse_error
+        profiler.record('parse_document', parse_seconds)
+        profiler.record('simulator', time.perf_counter() - start - parse_seconds)
+
+class ReplayBackend:
+    def __init__(self, env_parser, events_file_name, trace_dir=None, latency=0.0, synthetic=True, handover_rate=0.05):
+        self.env_parser = env_parser
+        self.events_file_name = events_file_name
+        # Traces are looked up as <key>.trace.gz or <key>.txt, with the key of
+        # Simulation_cache for the version recorded in trace_dir, else the one
+        # of gp.simulator_binary, so the traces the cache keeps next to its
+        # results (cache_simulation_traces) can be replayed straight from its
+        # directory, on machines without the binary too
+        self.trace_dir = trace_dir
+        self.versions = []
+        if trace_dir is not None:
+            self.versions = list(dict.fromkeys(
+                version for version in (recorded_version(trace_dir), simulator_version(gp.simulator_binary))
+                if version is not None))
+        self.latency = latency
+        self.synthetic = synthetic
+        self.handover_rate = handover_rate
+        self.replayed = 0
+        self.generated = 0
+
+    def recorded_trace(self, simulation):
+        for version in self.versions:
+            key = simulation_key(simulation, version)
+            for name, opener in ((key + '.trace.gz', gzip.open), (key + '.txt', open)):
+                path = os.path.join(self.trace_dir, name)
+                if os.path.exists(path):
+                    with opener(path, 'rt') as f:
+                        return f.readlines()
+        return None
+
+    def synthetic_trace(self, simulation):
+        # A lower NeighbourCellOffset makes ns-3 hand over sooner, so the
+        # synthetic handover rate falls with the offset and the agent still
+        # sees its action in the trace. The seed covers every argument.
+        offset = simulation['NeighbourCellOffset']
+        return generate_trace(ENB_Count=simulation['ENB_Count'], UE_Count=simulation['UE_Count'],
+                              duration=simulation['duration'],
+                              handover_rate=self.handover_rate * (gp.upper_limit + 1 - offset) / (gp.upper_limit / 2),
+                              speed=simulation['max_speed'], x_pos=simulation['x_pos'], y_pos=simulation['y_pos'],
+                              rho=simulation['rho'], seed=int(simulation_key(simulation)[:8], 16))
+
+    def run(self, simulation, data, keep_trace=False):
+        with profiler.stage('simulator'):
+            start = time.perf_counter()
+            lines = self.recorded_trace(simulation)
+            if lines is not None:
+                self.replayed += 1
+            elif self.synthetic:
+                if self.trace_dir is not None:
+                    print('Replay: no recorded trace in {} for {}, using a synthetic one'.format(
+                        self.trace_dir, simulation))
+                lines = self.synthetic_trace(simulation)
+                self.generated += 1
+            else:
+                raise LookupError('No recorded trace for simulation {}'.format(simulation))
+            # Stands in for the simulator run; the time spent finding the
+            # trace counts towards it
+            remaining = self.latency - (time.perf_counter() - start)
+            if remaining > 0:
+                time.sleep(remaining)
+        if keep_trace:
+            with open(self.events_file_name, 'w') as output:
+                output.writelines(lines)
+        with profiler.stage('parse_document'):
+            self.env_parser.parse_lines(data, lines)
+
+def create_backend(env_parser, events_file_name):
+    if gp.simulator_backend == 'ns3':
+        return NS3Backend(env_parser, events_file_name, gp.simulator_binary)
+    elif gp.simulator_backend == 'replay':
+        return ReplayBackend(env_parser, events_file_name, gp.replay_trace_dir, gp.replay_latency,
+                             gp.replay_synthetic, gp.replay_handover_rate)
+    raise ValueError('Unknown simulator backend {!r}'.format(gp.simulator_backend))
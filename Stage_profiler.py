@@ -0,0 +1,101 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+import time
+import numpy as np
+
+from Global_parameters import gp
+
+# Wall time of the stages of the episode pipeline (simulator, parser, feature
+# extraction, policy inference, learner, ...) and event counters. Stages are
+# timed with profiler.stage(name) around the code; when profiling is switched
+# off stage() hands back a shared do-nothing context manager, so the
+# instrumentation costs one attribute check. report() summarizes everything
+# recorded since the previous report as percentiles per stage and starts a
+# new interval.
+
+class StageTimer:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_TIMER = NullTimer()
+
+class StageProfiler:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.durations = {}
+        self.counters = {}
+        self.interval_start = time.perf_counter()
+
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_TIMER
+        return StageTimer(self, name)
+
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.durations.setdefault(name, []).append(seconds)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self):
+        with self.lock:
+            durations, counters = self.durations, self.counters
+            wall_time = time.perf_counter() - self.interval_start
+            self.reset()
+        stages = {}
+        for name, values in durations.items():
+            values = np.array(values)
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            stages[name] = {
+                'count': len(values),
+                'total': float(values.sum()),
+                'mean': float(values.mean()),
+                'p50': float(p50),
+                'p90': float(p90),
+                'p99': float(p99),
+                'max': float(values.max()),
+            }
+        return {'wall_time': wall_time, 'stages': stages, 'counters': counters}
+
+def export_tensorboard(summary, step, writer):
+    # Imported here so the profiler itself does not pull in TensorFlow
+    import tensorflow as tf
+    with writer.as_default():
+        for name, stats in summary['stages'].items():
+            for key in ('mean', 'p50', 'p90', 'p99'):
+                tf.summary.scalar('stages/{}/{}'.format(name, key), stats[key], step=step)
+            tf.summary.scalar('stages/{}/share'.format(name), stats['total'] / summary['wall_time'], step=step)
+        for name, value in summary['counters'].items():
+            tf.summary.scalar('counters/{}'.format(name), value, step=step)
+    writer.flush()
+
+profiler = StageProfiler(gp.profile_stages)
@@ -0,0 +1,130 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+
+import numpy as np
+
+from Global_parameters import gp
+from Run_state import RingBuffer
+from Scenario_scheduler import DURATIONS, POSITIONS, RHO, SPEEDS
+
+# Online surrogate of the simulator. A bootstrap ensemble of ridge
+# regressions maps the scenario and the two handover parameters of a
+# simulation to its reward and observation, trained on every episode that
+# really was simulated. Each member sees every episode with a Poisson(1)
+# weight, so the spread of the member predictions estimates how much the
+# model can be trusted at that point. A training environment takes the
+# predicted episode instead of running the simulator when the spread is
+# below max_uncertainty and the error measured on the recent simulated
+# episodes is below max_error, except for a random audit_rate share of those
+# episodes, which are simulated anyway so the prediction error keeps being
+# measured where the surrogate is used. The spread cannot see the noise of
+# the simulator itself (RngRun), the measured error can.
+
+FEATURE_INPUTS = ['duration', 'UE_Count', 'max_speed', 'x_pos', 'y_pos', 'rho',
+                  'NeighbourCellOffset', 'ServingCellThreshold']
+
+class SurrogateModel:
+    def __init__(self, state_size, members=5, ridge=1e-2, min_samples=50, max_uncertainty=0.1,
+                 max_error=0.2, audit_rate=0.1, history=100, seed=0):
+        self.members = members
+        self.ridge = ridge
+        self.min_samples = min_samples
+        self.max_uncertainty = max_uncertainty
+        self.max_error = max_error
+        self.audit_rate = audit_rate
+        self.rng = np.random.default_rng(seed)
+        size = len(self.features(dict.fromkeys(FEATURE_INPUTS, 0)))
+        # Weighted normal equations of every member; column 0 of the targets
+        # is the reward, the rest the observation
+        self.gram = np.zeros((members, size, size))
+        self.moments = np.zeros((members, size, state_size + 1))
+        self.weights = None
+        self.samples = 0
+        self.imagined = 0
+        self.audits = 0
+        self.errors = RingBuffer(history)
+        self.rewards = RingBuffer(history)
+        self.lock = threading.Lock()
+
+    def features(self, simulation):
+        # Scenario and action scaled to about [0, 1] by the bounds of the
+        # training scenarios and the action box, with the second order action
+        # terms the reward surface needs
+        action_range = gp.upper_limit - gp.lower_limit
+        offset = (simulation['NeighbourCellOffset'] - gp.lower_limit) / action_range
+        threshold = (simulation['ServingCellThreshold'] - gp.lower_limit) / action_range
+        return np.array([
+            1.0,
+            simulation['duration'] / max(DURATIONS),
+            simulation['UE_Count'] / gp.UE_upper_count,
+            simulation['max_speed'] / max(SPEEDS),
+            simulation['x_pos'] / max(POSITIONS),
+            simulation['y_pos'] / max(POSITIONS),
+            simulation['rho'] / RHO,
+            offset,
+            threshold,
+            offset * offset,
+            threshold * threshold,
+            offset * threshold,
+        ])
+
+    def ready(self):
+        return self.samples >= self.min_samples
+
+    def predict(self, simulation):
+        # None until the model has seen min_samples episodes
+        with self.lock:
+            if not self.ready():
+                return None
+            if self.weights is None:
+                eye = self.ridge * np.eye(self.gram.shape[1])
+                self.weights = np.stack([np.linalg.solve(gram + eye, moments)
+                                         for gram, moments in zip(self.gram, self.moments)])
+            weights = self.weights
+        outputs = np.einsum('f,mfo->mo', self.features(simulation), weights)
+        return {
+            'reward': float(outputs[:, 0].mean()),
+            'state': outputs[:, 1:].mean(axis=0),
+            'uncertainty': float(outputs[:, 0].std()),
+        }
+
+    def use(self, prediction):
+        # Whether to take the predicted episode instead of simulating
+        if prediction is None or prediction['uncertainty'] > self.max_uncertainty:
+            return False
+        with self.lock:
+            if len(self.errors) == 0 or np.sqrt((self.errors.values() ** 2).mean()) > self.max_error:
+                return False
+            if self.rng.random() < self.audit_rate:
+                self.audits += 1
+                return False
+            self.imagined += 1
+        return True
+
+    def update(self, simulation, state, reward, prediction=None):
+        x = self.features(simulation)
+        y = np.concatenate(([reward], np.asarray(state, dtype=np.float64)))
+        with self.lock:
+            if prediction is not None:
+                self.errors.append(prediction['reward'] - reward)
+                self.rewards.append(reward)
+            sample_weights = self.rng.poisson(1.0, self.members)
+            self.gram += sample_weights[:, None, None] * np.outer(x, x)
+            self.moments += sample_weights[:, None, None] * np.outer(x, y)
+            self.weights = None
+            self.samples += 1
+
+    def summary(self):
+        # Accuracy on the recent simulated episodes the model had predicted
+        with self.lock:
+            summary = {'samples': self.samples, 'imagined': self.imagined, 'audits': self.audits}
+            if len(self.errors) > 0:
+                errors, rewards = self.errors.values(), self.rewards.values()
+                summary['mae'] = float(np.abs(errors).mean())
+                summary['rmse'] = float(np.sqrt((errors ** 2).mean()))
+                if len(rewards) > 1 and rewards.var() > 0:
+                    summary['r2'] = float(1 - (errors ** 2).mean() / rewards.var())
+        return summary
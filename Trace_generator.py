@@ -0,0 +1,147 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import math
+import random
+
+# Synthetic simulator traces, printed line for line in the format simulator.cc
+# writes to stdout (Cell state, UE state, UE seen at cell and Measurement
+# report records), so the parser and the feature extraction can be exercised
+# and benchmarked without ns-3. The network is a hexagonal grid of 3-sector
+# sites, UEs move in straight lines with random direction changes inside the
+# simulator's bounds, report their state every 100 ms and send a measurement
+# report every 480 ms. Signal levels fall off with the distance to a cell and
+# a UE hands over to its strongest other cell at handover_rate handovers per
+# UE per second. Handovers print as ConnectionEstablished, as they do in the
+# simulator's own traces.
+
+BOUNDS = (-600, 600, -400, 800)
+SITE_SPACING = 500
+UE_STATE_INTERVAL = 100
+MEASUREMENT_INTERVAL = 480
+
+def site_positions(count):
+    # Centre site first, then rings of the hexagonal grid, starting at 120
+    # degrees like the sample trace of simulator.cc
+    positions = [(0.0, 0.0)]
+    ring = 1
+    while len(positions) < count:
+        for side in range(6):
+            corner = math.radians(120 + 60 * side)
+            angle = corner + math.radians(120)
+            start = (ring * SITE_SPACING * math.cos(corner), ring * SITE_SPACING * math.sin(corner))
+            for step in range(ring):
+                positions.append((start[0] + step * SITE_SPACING * math.cos(angle),
+                                  start[1] + step * SITE_SPACING * math.sin(angle)))
+        ring += 1
+    return positions[:count]
+
+def cell_positions(enb_count):
+    # Like LteHexGridEnbTopologyHelper, the sectors of a site sit 0.5 m from
+    # its centre along their antenna direction
+    sites = site_positions((enb_count + 2) // 3)
+    cells = []
+    for index in range(enb_count):
+        site_x, site_y = sites[index // 3]
+        direction = (index % 3) * 120
+        cells.append((site_x + 0.5 * math.cos(math.radians(direction)),
+                      site_y + 0.5 * math.sin(math.radians(direction)), direction))
+    return cells
+
+def number(value):
+    # std::cout prints doubles with 6 significant digits; rounding first keeps
+    # cos/sin noise such as 6.12323e-14 out of the coordinates
+    return '{:g}'.format(round(value, 6) + 0.0)
+
+def signal(cell, x, y):
+    # RSRP and RSRQ report ranges, falling off with the distance to the cell
+    # and with the angle off its antenna direction (parabolic sector pattern)
+    cell_x, cell_y, direction = cell
+    distance = math.hypot(x - cell_x, y - cell_y)
+    off_axis = abs((math.degrees(math.atan2(y - cell_y, x - cell_x)) - direction + 180) % 360 - 180)
+    attenuation = min(12 * (off_axis / 70) ** 2, 20)
+    rsrp = int(min(97, max(0, round(95 - 22 * math.log10(max(distance, 1.0)) - attenuation))))
+    rsrq = int(min(34, max(0, round(34 - distance / 25 - attenuation / 2))))
+    return rsrp, rsrq
+
+def generate_trace(ENB_Count=5, UE_Count=8, duration=60, handover_rate=0.05, speed=20,
+                   x_pos=0, y_pos=300, rho=200, seed=0):
+    rng = random.Random(seed)
+    duration_ms = duration * 1000
+    cells = cell_positions(ENB_Count)
+    events = []
+
+    def add(time, text):
+        events.append((time, len(events), '{} ms: {}\n'.format(time, text)))
+
+    for cell, (x, y, direction) in enumerate(cells, start=1):
+        add(0, 'Cell state: Cell {} at {} {} direction {}'.format(cell, number(x), number(y), direction))
+
+    for imsi in range(1, UE_Count + 1):
+        angle = rng.uniform(0, 2 * math.pi)
+        radius = rho * math.sqrt(rng.random())
+        x, y = x_pos + radius * math.cos(angle), y_pos + radius * math.sin(angle)
+        heading = rng.uniform(0, 2 * math.pi)
+        step_length = speed * UE_STATE_INTERVAL / 1000
+
+        attach_time = rng.choice([260, 265])
+        measurement_time = 400
+        serving = None
+        for time in range(0, duration_ms, UE_STATE_INTERVAL):
+            signals = [signal(cell, x, y) for cell in cells]
+            ranked = sorted(range(ENB_Count), key=lambda cell: signals[cell], reverse=True)
+            received = 0
+            if serving is not None and time >= 1000:
+                rsrq = signals[serving][1]
+                received = int(125000 * rsrq / 34 * rng.uniform(0.8, 1.0))
+            add(time, 'UE state: IMSI {} at {} {} with {} received bytes'.format(imsi, number(x), number(y), received))
+
+            if serving is None and time + UE_STATE_INTERVAL > attach_time:
+                serving = ranked[0]
+                add(attach_time, 'UE seen at cell: Cell {} saw IMSI {} (context: /NodeList/{}/DeviceList/0/LteEnbRrc/ConnectionEstablished)'.format(
+                    serving + 1, imsi, serving + 3))
+            elif serving is not None and ENB_Count > 1 and rng.random() < handover_rate * UE_STATE_INTERVAL / 1000:
+                serving = next(cell for cell in ranked if cell != serving)
+                add(time + rng.randrange(1, UE_STATE_INTERVAL), 'UE seen at cell: Cell {} saw IMSI {} (context: /NodeList/{}/DeviceList/0/LteEnbRrc/ConnectionEstablished)'.format(
+                    serving + 1, imsi, serving + 3))
+
+            while serving is not None and measurement_time < time + UE_STATE_INTERVAL:
+                reported = [serving] + [cell for cell in ranked[:3] if cell != serving][:2]
+                measurements = ' '.join('{}:{}/{}'.format(cell + 1, *signals[cell]) for cell in reported)
+                for meas_id in (2, 3):
+                    add(measurement_time, 'Measurement report: Cell {} got measurements from IMSI {} (ID {}, cell:RSRP/RSRQ {})'.format(
+                        serving + 1, imsi, meas_id, measurements))
+                measurement_time += MEASUREMENT_INTERVAL
+
+            if rng.random() < 0.02:
+                heading = rng.uniform(0, 2 * math.pi)
+            x += step_length * math.cos(heading)
+            y += step_length * math.sin(heading)
+            if not BOUNDS[0] <= x <= BOUNDS[1]:
+                heading = math.pi - heading
+                x = min(max(x, BOUNDS[0]), BOUNDS[1])
+            if not BOUNDS[2] <= y <= BOUNDS[3]:
+                heading = -heading
+                y = min(max(y, BOUNDS[2]), BOUNDS[3])
+
+    events.sort()
+    return [line for time, _, line in events if time < duration_ms]
+
+def write_trace(file_name, **kwargs):
+    with open(file_name, 'w') as f:
+        f.writelines(generate_trace(**kwargs))
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Write a synthetic simulator trace')
+    arg_parser.add_argument('output')
+    arg_parser.add_argument('--ENB_Count', type=int, default=5)
+    arg_parser.add_argument('--UE_Count', type=int, default=8)
+    arg_parser.add_argument('--duration', type=int, default=60, help='Simulated seconds')
+    arg_parser.add_argument('--handover_rate', type=float, default=0.05, help='Handovers per UE per second')
+    arg_parser.add_argument('--speed', type=float, default=20, help='UE speed in m/s')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+    write_trace(args.output, ENB_Count=args.ENB_Count, UE_Count=args.UE_Count, duration=args.duration,
+                handover_rate=args.handover_rate, speed=args.speed, seed=args.seed)
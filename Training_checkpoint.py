@@ -0,0 +1,145 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tensorflow as tf
+
+# Checkpoints everything a crashed run needs to carry on without simulating
+# again: the agent with its networks and optimizers and the train step
+# (tf.train.Checkpoint), the Reverb table (the server's own checkpointer, see
+# RL_agent.create_reverb_checkpointer), the episode and scenario counters of
+# the environments with the state of the random module that draws the
+# scenarios, and the level of the fidelity schedule. The TensorFlow checkpoint is written asynchronously where
+# TensorFlow supports it and the Reverb checkpoint in a background thread, so
+# save() returns to the learner right away. checkpoints.json records for every
+# agent checkpoint the environment state and the table checkpoint taken with
+# it, once that is complete; a run resumes from the newest agent checkpoint
+# that has its table, and the server starts from that table (resume_table). A
+# save that comes while the last table checkpoint is still being written is
+# skipped as a whole, so agent and table always come from the same save.
+
+MANIFEST = 'checkpoints.json'
+
+def table_root(directory):
+    return os.path.join(directory, 'reverb')
+
+def new_table_directory(directory):
+    # Every run checkpoints the Reverb table to a directory of its own, so
+    # the server of a run that does not resume never finds an old table
+    # there; save_table removes the ones no agent checkpoint refers to
+    return os.path.join(table_root(directory), '{}_{}'.format(time.strftime('%Y%m%d_%H%M%S'), os.getpid()))
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def resume_point(directory):
+    # Path and record of the newest agent checkpoint with a complete table
+    # checkpoint, or (None, None)
+    state = tf.train.get_checkpoint_state(os.path.join(directory, 'agent'))
+    if state is None:
+        return None, None
+    manifest = read_manifest(directory)
+    for path in reversed(state.all_model_checkpoint_paths):
+        record = manifest.get(os.path.basename(path))
+        if record is not None and os.path.exists(os.path.join(record['table'], 'DONE')):
+            return path, record
+    return None, None
+
+def resume_table(directory):
+    # The table checkpoint a resumed run starts its server from, or None
+    _, record = resume_point(directory)
+    return None if record is None else record['table']
+
+class TrainingCheckpointer:
+    def __init__(self, directory, agent, train_step, reverb_client, envs, fidelity=None, max_to_keep=3,
+                 async_checkpoint=True):
+        self.directory = directory
+        self.reverb_client = reverb_client
+        self.envs = envs
+        self.fidelity = fidelity
+        self.checkpoint = tf.train.Checkpoint(agent=agent, train_step=train_step)
+        self.manager = tf.train.CheckpointManager(self.checkpoint, os.path.join(directory, 'agent'), max_to_keep)
+        self.options = None
+        if async_checkpoint and hasattr(tf.train.CheckpointOptions(), 'experimental_enable_async_checkpoint'):
+            self.options = tf.train.CheckpointOptions(experimental_enable_async_checkpoint=True)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reverb_checkpoint')
+        self.reverb_future = None
+        os.makedirs(directory, exist_ok=True)
+
+    def restore(self):
+        # Returns whether there was a checkpoint to resume from. The Reverb
+        # table is loaded by the server itself when it starts.
+        path, record = resume_point(self.directory)
+        if path is None:
+            return False
+        self.checkpoint.restore(path)
+        for env in self.envs:
+            if env.name in record['envs']:
+                env.set_state(record['envs'][env.name])
+        if self.fidelity is not None and record.get('fidelity') is not None:
+            self.fidelity.set_state(record['fidelity'])
+        version, internal_state, gauss = record['random']
+        random.setstate((version, tuple(internal_state), gauss))
+        print('Resumed from', path, 'with the replay table', record['table'])
+        return True
+
+    def save(self, step, wait=False):
+        # Returns whether the checkpoint was taken. wait takes it even when
+        # the last table checkpoint is still running, and returns once its
+        # own is written, e.g. for the last one of a run
+        if self.reverb_future is not None and not self.reverb_future.done():
+            if not wait:
+                print('Checkpoint of step', step, 'skipped, the last table checkpoint is still being written')
+                return False
+            self.reverb_future.result()
+        path = self.manager.save(checkpoint_number=step, options=self.options)
+        record = {
+            'step': int(step),
+            'envs': {env.name: env.get_state() for env in self.envs},
+            'random': random.getstate(),
+            'fidelity': self.fidelity.get_state() if self.fidelity is not None else None,
+        }
+        self.reverb_future = self.executor.submit(self.save_table, path, record)
+        if wait:
+            self.reverb_future.result()
+        return True
+
+    def save_table(self, path, record):
+        # On the checkpoint thread: the table checkpoint of the agent
+        # checkpoint at path, recorded once it is complete. Records and tables
+        # of the agent checkpoints the manager has deleted go too, and so do
+        # the table directories of earlier runs once none of theirs is left
+        record['table'] = self.reverb_client.checkpoint()
+        manifest = read_manifest(self.directory)
+        manifest[os.path.basename(path)] = record
+        kept = set(os.path.basename(checkpoint) for checkpoint in self.manager.checkpoints)
+        for name in list(manifest):
+            if name not in kept:
+                shutil.rmtree(manifest.pop(name)['table'], ignore_errors=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(self.directory, MANIFEST))
+        used = set(os.path.dirname(os.path.abspath(record['table'])) for record in manifest.values())
+        root = table_root(self.directory)
+        for name in os.listdir(root):
+            run_directory = os.path.abspath(os.path.join(root, name))
+            if run_directory not in used:
+                shutil.rmtree(run_directory, ignore_errors=True)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self.options is not None and hasattr(self.checkpoint, 'sync'):
+            self.checkpoint.sync()
@@ -0,0 +1,260 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import datatracker
+from Environment_parser import Environment_parser
+from Feature_engine import FeatureEngine
+from Global_parameters import gp
+from Trace_generator import write_trace
+
+# Benchmarks of the episode pipeline that run without ns-3.
+#
+# The stage suite writes synthetic traces (Trace_generator) of growing size
+# and times parse_document, find_cell_ue_dicts, Add_more_cell_info,
+# find_state and find_reward on each of them, and the same episode through
+# Feature_engine: parsing into it with finalize() (incremental_parse) and its
+# find_state and find_reward (incremental_features). Results can be saved as JSON and
+# compared with a stored baseline; a stage that got slower than the baseline
+# by more than the tolerance is reported as a regression and makes the run
+# exit with status 1.
+#
+# The parser benchmark builds a large trace by repeating a recorded simulator
+# trace back to back, shifting the timestamps of every copy so the time series
+# stay sorted, and times both parser engines on it.
+
+SCALES = [
+    {'name': 'small', 'ENB_Count': 5, 'UE_Count': 8, 'duration': 60},
+    {'name': 'medium', 'ENB_Count': 9, 'UE_Count': 32, 'duration': 120},
+    {'name': 'large', 'ENB_Count': 15, 'UE_Count': 64, 'duration': 300},
+]
+STAGES = ['parse_document', 'find_cell_ue_dicts', 'Add_more_cell_info', 'find_state', 'find_reward',
+          'incremental_parse', 'incremental_features']
+
+def load_trace(file_name, repeat):
+    with open(file_name, 'r') as f:
+        lines = f.readlines()
+    last_time = 0
+    for line in lines:
+        time_text, sep, _ = line.partition(' ms: ')
+        if sep:
+            last_time = max(last_time, int(time_text))
+    span = last_time + 100
+    trace = []
+    for copy in range(repeat):
+        for line in lines:
+            time_text, sep, record = line.partition(' ms: ')
+            if sep:
+                trace.append('{} ms: {}'.format(int(time_text) + copy * span, record))
+    return trace
+
+def time_parser(parse, trace, rounds):
+    best = None
+    for _ in range(rounds):
+        data = datatracker.Data()
+        start = time.perf_counter()
+        parse(data, trace)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, data
+
+def benchmark_parser(trace, rounds):
+    env_parser = Environment_parser()
+    legacy_time, legacy_data = time_parser(env_parser.parse_lines_legacy, trace, rounds)
+    parser_time, parser_data = time_parser(env_parser.parse_lines, trace, rounds)
+    if legacy_data.data != parser_data.data:
+        raise RuntimeError('parse_lines and parse_lines_legacy produced different data')
+    return {
+        'lines': len(trace),
+        'legacy_lines_per_sec': len(trace) / legacy_time,
+        'parser_lines_per_sec': len(trace) / parser_time,
+        'speedup': legacy_time / parser_time,
+    }
+
+def deep_size(obj, seen):
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (list, tuple)):
+        size += sum(deep_size(item, seen) for item in obj)
+    return size
+
+def benchmark_memory(trace):
+    # Bytes per sample of the columnar series against the same samples held
+    # as lists of (timestep, value) tuples
+    data = datatracker.Data()
+    Environment_parser().parse_lines(data, trace)
+    data.compact()
+    samples = 0
+    tuple_bytes = 0
+    for objects in data.data.values():
+        for series in objects.values():
+            for timeseries in series.values():
+                samples += len(timeseries)
+                tuple_bytes += deep_size(timeseries.tolist(), set())
+    return {
+        'samples': samples,
+        'tuple_bytes_per_sample': tuple_bytes / samples,
+        'columnar_bytes_per_sample': data.nbytes / samples,
+        'reduction': tuple_bytes / data.nbytes,
+    }
+
+def time_stages(env_parser, trace_file, scale):
+    timings = {}
+
+    def timed(name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        timings[name] = time.perf_counter() - start
+        return result
+
+    duration, UE_Count = scale['duration'], scale['UE_Count']
+    data = datatracker.Data()
+    timed('parse_document', env_parser.parse_document, data, trace_file)
+    ue_cell_connection, cell_connected_ue = timed('find_cell_ue_dicts', env_parser.find_cell_ue_dicts, data.data, duration * 1000)
+    cell_connected_ue, cell_info = timed('Add_more_cell_info', env_parser.Add_more_cell_info, data.data, cell_connected_ue)
+    episode = {}
+    timed('find_state', env_parser.find_state, cell_info, ue_cell_connection, UE_Count, duration, episode,
+          scale['speed'], scale['speed'])
+    timed('find_reward', env_parser.find_reward, data, cell_connected_ue, duration, UE_Count, episode)
+
+    def parse_incremental():
+        engine = FeatureEngine(scale['ENB_Count'], duration * 1000)
+        env_parser.parse_document(engine, trace_file)
+        engine.finalize()
+        return engine
+
+    def features_incremental(engine):
+        episode = {}
+        engine.find_state(UE_Count, duration, episode, scale['speed'], scale['speed'])
+        engine.find_reward(duration, UE_Count, episode)
+
+    engine = timed('incremental_parse', parse_incremental)
+    timed('incremental_features', features_incremental, engine)
+    return timings
+
+def benchmark_stages(scales, rounds, handover_rate=0.05, speed=20, seed=0):
+    # The stages read the global parameters like they do during training, so
+    # those are pointed at the scenario and restored afterwards.
+    # The quality log of Add_more_cell_info goes to the null device and the
+    # prints of find_state are swallowed.
+    saved = dict(gp.__dict__)
+    gp.rsrq_throughput_file = os.devnull
+    env_parser = Environment_parser()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for scale in scales:
+                scale = dict(scale, speed=speed)
+                trace_file = os.path.join(directory, scale['name'] + '.txt')
+                write_trace(trace_file, ENB_Count=scale['ENB_Count'], UE_Count=scale['UE_Count'], duration=scale['duration'],
+                            handover_rate=handover_rate, speed=speed, seed=seed)
+                with open(trace_file, 'r') as f:
+                    lines = sum(1 for _ in f)
+                gp.ENB_Count = scale['ENB_Count']
+                best = {}
+                for _ in range(rounds):
+                    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+                        timings = time_stages(env_parser, trace_file, scale)
+                    for name, seconds in timings.items():
+                        best[name] = min(best.get(name, seconds), seconds)
+                results.append({
+                    'name': scale['name'],
+                    'ENB_Count': scale['ENB_Count'],
+                    'UE_Count': scale['UE_Count'],
+                    'duration': scale['duration'],
+                    'lines': lines,
+                    'stages': best,
+                })
+    finally:
+        gp.__dict__.clear()
+        gp.__dict__.update(saved)
+    return results
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    baseline_scales = {scale['name']: scale for scale in baseline['scales']}
+    for scale in results['scales']:
+        reference = baseline_scales.get(scale['name'])
+        if reference is None or reference['lines'] != scale['lines']:
+            # A different trace is not comparable
+            continue
+        for name, seconds in scale['stages'].items():
+            if name not in reference['stages']:
+                continue
+            ratio = seconds / reference['stages'][name]
+            if ratio > 1 + tolerance:
+                regressions.append({'scale': scale['name'], 'stage': name, 'baseline': reference['stages'][name],
+                                    'current': seconds, 'ratio': ratio})
+    return regressions
+
+def print_stages(results, baseline):
+    reference = {scale['name']: scale for scale in baseline['scales']} if baseline else {}
+    for scale in results:
+        print('{name}: ENB_Count = {ENB_Count}: UE_Count = {UE_Count}: duration = {duration} s: lines = {lines}'.format(**scale))
+        for name in STAGES:
+            if name not in scale['stages']:
+                continue
+            seconds = scale['stages'][name]
+            line = '    {0:<20} {1:9.4f} s'.format(name, seconds)
+            if scale['name'] in reference and name in reference[scale['name']]['stages']:
+                line += '   x{0:.2f} of baseline'.format(seconds / reference[scale['name']]['stages'][name])
+            print(line)
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Benchmark the simulator trace parser and the feature extraction')
+    arg_parser.add_argument('--rounds', type=int, default=3, help='Timed rounds, the best one is reported')
+    arg_parser.add_argument('--scales', nargs='+', default=[scale['name'] for scale in SCALES],
+                            choices=[scale['name'] for scale in SCALES], help='Synthetic trace sizes of the stage suite')
+    arg_parser.add_argument('--handover_rate', type=float, default=0.05, help='Handovers per UE per second in the synthetic traces')
+    arg_parser.add_argument('--output', default='output/benchmark.json', help='Where the results are saved as JSON')
+    arg_parser.add_argument('--baseline', default='output/benchmark_baseline.json', help='Stored results to compare with')
+    arg_parser.add_argument('--save_baseline', action='store_true', help='Store these results as the new baseline')
+    arg_parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown of a stage against the baseline')
+    arg_parser.add_argument('--trace', default='output/simulatorFile.txt', help='Recorded trace of the parser benchmark')
+    arg_parser.add_argument('--repeat', type=int, default=20, help='Copies of the recorded trace to parse back to back')
+    arg_parser.add_argument('--skip_parser', action='store_true', help='Only run the stage suite')
+    args = arg_parser.parse_args()
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    results = {'scales': benchmark_stages([scale for scale in SCALES if scale['name'] in args.scales], args.rounds,
+                                          handover_rate=args.handover_rate)}
+    print_stages(results['scales'], baseline)
+
+    if not args.skip_parser and os.path.exists(args.trace):
+        trace = load_trace(args.trace, args.repeat)
+        results['parser'] = benchmark_parser(trace, args.rounds)
+        print('lines = {0}: legacy = {1:.0f} lines/s: parser = {2:.0f} lines/s: speedup = {3:.2f}x'.format(
+            results['parser']['lines'], results['parser']['legacy_lines_per_sec'], results['parser']['parser_lines_per_sec'],
+            results['parser']['speedup']))
+        results['memory'] = benchmark_memory(trace)
+        print('samples = {0}: tuple lists = {1:.1f} B/sample: columnar = {2:.1f} B/sample: reduction = {3:.1f}x'.format(
+            results['memory']['samples'], results['memory']['tuple_bytes_per_sample'],
+            results['memory']['columnar_bytes_per_sample'], results['memory']['reduction']))
+
+    for file_name in [args.output] + ([args.baseline] if args.save_baseline else []):
+        directory = os.path.dirname(file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(file_name, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION {scale}/{stage}: {baseline:.4f} s -> {current:.4f} s (x{ratio:.2f})'.format(**regression))
+        if regressions:
+            sys.exit(1)
@@ -1,9 +1,144 @@
 import re
+import numpy as np
 
 # Data structure to keep all the imported time series data, either related to
 # a particular UE or cell. This data structure is a nested dictionary keyed on
-# data[obj_type][obj_id][timeseries_name], each entry containing a sorted list
-# of (timestep, value) tuples, with obj_type as either 'ue' or 'cell'
+# data[obj_type][obj_id][timeseries_name], each entry containing a Timeseries
+# sorted by timestep, with obj_type as either 'ue' or 'cell'
+
+# A Timeseries keeps the samples of one series as two parallel NumPy arrays,
+# timestamps and values, instead of a list of (timestep, value) tuples. Scalar
+# values are stored as int32 (int64 when a value needs it) or float64, tuples
+# such as coords as rows of a float64 matrix. Appends are staged in small
+# Python lists and moved into the arrays in blocks, so appending stays as cheap
+# as a list append. Time queries are binary searches on the timestamps and
+# return views into the arrays. Iterating and indexing still gives
+# (timestep, value) tuples, so code written against the tuple lists keeps
+# working
+
+STAGED_SAMPLES = 4096
+
+class Timeseries:
+    def __init__(self):
+        self._capacity = 0
+        self._size = 0
+        self._times = None
+        self._values = None
+        self._staged_times = []
+        self._staged_values = []
+
+    def append(self, timestep, value):
+        self._staged_times.append(timestep)
+        self._staged_values.append(value)
+        if len(self._staged_times) >= STAGED_SAMPLES:
+            self._flush()
+
+    def _flush(self):
+        if not self._staged_times:
+            return
+        times = np.array(self._staged_times, dtype=np.int64)
+        values = np.array(self._staged_values)
+        self._staged_times = []
+        self._staged_values = []
+        if values.dtype.kind in 'iub':
+            values = values.astype(np.int64)
+            if (self._values is None or self._values.dtype == np.int32) and len(values) > 0 and \
+                    values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max:
+                values = values.astype(np.int32)
+        else:
+            values = values.astype(np.float64)
+        if self._values is None:
+            self._times = np.empty((0,), dtype=np.int32)
+            self._values = np.empty((0,) + values.shape[1:], dtype=values.dtype)
+        elif self._values.dtype != np.result_type(self._values, values):
+            self._values = self._values.astype(np.result_type(self._values, values))
+        if times.max() > np.iinfo(np.int32).max and self._times.dtype == np.int32:
+            self._times = self._times.astype(np.int64)
+        size = self._size + len(times)
+        if size > self._capacity:
+            self._resize(max(size, 2 * self._capacity))
+        self._times[self._size:size] = times
+        self._values[self._size:size] = values
+        self._size = size
+
+    def _resize(self, capacity):
+        times = np.empty(capacity, dtype=self._times.dtype)
+        values = np.empty((capacity,) + self._values.shape[1:], dtype=self._values.dtype)
+        times[:self._size] = self._times[:self._size]
+        values[:self._size] = self._values[:self._size]
+        self._times, self._values = times, values
+        self._capacity = capacity
+
+    def compact(self):
+        # Drop the spare capacity left over from appending
+        self._flush()
+        if self._times is not None and self._capacity > self._size:
+            self._resize(self._size)
+
+    @property
+    def times(self):
+        self._flush()
+        if self._times is None:
+            return np.empty(0, dtype=np.int32)
+        return self._times[:self._size]
+
+    @property
+    def values(self):
+        self._flush()
+        if self._values is None:
+            return np.empty(0, dtype=np.float64)
+        return self._values[:self._size]
+
+    @property
+    def nbytes(self):
+        self._flush()
+        if self._times is None:
+            return 0
+        return self._times.nbytes + self._values.nbytes
+
+    def until(self, timestep):
+        # Views of all samples with time <= timestep
+        end = np.searchsorted(self.times, timestep, side='right')
+        return self.times[:end], self.values[:end]
+
+    def between(self, start, end):
+        # Views of all samples with start <= time <= end
+        times = self.times
+        first = np.searchsorted(times, start, side='left')
+        last = np.searchsorted(times, end, side='right')
+        return times[first:last], self.values[first:last]
+
+    def _python_values(self, values):
+        if values.ndim > 1:
+            return [tuple(value) for value in values.tolist()]
+        return values.tolist()
+
+    def tolist(self):
+        return list(zip(self.times.tolist(), self._python_values(self.values)))
+
+    def __len__(self):
+        return self._size + len(self._staged_times)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(zip(self.times[index].tolist(), self._python_values(self.values[index])))
+        times, values = self.times, self.values
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('Timeseries index out of range')
+        return times[index].item(), self._python_values(values[index:index+1])[0]
+
+    def __eq__(self, other):
+        if isinstance(other, Timeseries):
+            other = other.tolist()
+        return self.tolist() == other
+
+    def __repr__(self):
+        return 'Timeseries({})'.format(self.tolist())
 
 class Data:
     def __init__(self):
@@ -20,9 +155,30 @@ class Data:
             self.data[obj_type][obj_id] = {}
         for key, value in d.items():
             if key not in self.data[obj_type][obj_id]:
-                self.data[obj_type][obj_id][key] = []
-            # Append (timestep, value) tuples to a list such as data['ue'][2]['bytes_rx']
-            self.data[obj_type][obj_id][key].append((timestep, value))
+                self.data[obj_type][obj_id][key] = Timeseries()
+            # Append a (timestep, value) sample to a series such as data['ue'][2]['bytes_rx']
+            self.data[obj_type][obj_id][key].append(timestep, value)
+
+    def append(self, timestep, obj_type, obj_id, key, value):
+        # Single value fast path of add_data, used by the trace parser
+        objects = self.data[obj_type]
+        if obj_id not in objects:
+            objects[obj_id] = {}
+        series = objects[obj_id].get(key)
+        if series is None:
+            series = objects[obj_id][key] = Timeseries()
+        series.append(timestep, value)
+
+    def compact(self):
+        for objects in self.data.values():
+            for series in objects.values():
+                for timeseries in series.values():
+                    timeseries.compact()
+
+    @property
+    def nbytes(self):
+        return sum(timeseries.nbytes for objects in self.data.values()
+                   for series in objects.values() for timeseries in series.values())
 
     def get_objects(self, obj_type):
         return sorted(self.data[obj_type].keys())
@@ -31,9 +187,24 @@ class Data:
         return (obj_type in self.data) and (obj_id in self.data[obj_type]) and (key in self.data[obj_type][obj_id])
 
     def get_timeseries(self, until_timestep, obj_type, obj_id, key):
+        # List of the (timestep, value) samples up to until_timestep; see
+        # get_timeseries_until for the same samples without the copy
+        if not self.timeseries_valid(obj_type, obj_id, key):
+            return None
+        timeseries = self.data[obj_type][obj_id][key]
+        return timeseries[:len(timeseries.until(until_timestep)[0])]
+
+    def get_timeseries_until(self, until_timestep, obj_type, obj_id, key):
+        # Returns (timesteps, values) views of the samples up to until_timestep
+        if not self.timeseries_valid(obj_type, obj_id, key):
+            return None
+        return self.data[obj_type][obj_id][key].until(until_timestep)
+
+    def get_timeseries_range(self, start_timestep, end_timestep, obj_type, obj_id, key):
+        # Returns (timesteps, values) views of the samples in [start, end]
         if not self.timeseries_valid(obj_type, obj_id, key):
             return None
-        return list(filter(lambda t: t[0] <= until_timestep, self.data[obj_type][obj_id][key]))
+        return self.data[obj_type][obj_id][key].between(start_timestep, end_timestep)
 
     def get_full_timeseries(self, obj_type, obj_id, key):
         if not self.timeseries_valid(obj_type, obj_id, key):
@@ -43,9 +214,10 @@ class Data:
     def get_value(self, until_timestep, obj_type, obj_id, key):
         if not self.timeseries_valid(obj_type, obj_id, key):
             return None
-        timeseries = self.get_timeseries(until_timestep, obj_type, obj_id, key)
-        # Take the latest (timestep, value) tuple and return only the value
-        return timeseries[-1][1] if len(timeseries) > 0 else None
+        timeseries = self.data[obj_type][obj_id][key]
+        count = len(timeseries.until(until_timestep)[0])
+        # Take the latest (timestep, value) sample and return only the value
+        return timeseries[count - 1][1] if count > 0 else None
 
     def get_latest_value(self, obj_type, obj_id, key, else_val=None):
         if not self.timeseries_valid(obj_type, obj_id, key):
@@ -1,100 +1,160 @@
-from __future__ import absolute_import
-from __future__ import division
-from __future__ import print_function
-
-import subprocess
-
-
-from tensorflow.python.ops.numpy_ops import np_config
-np_config.enable_numpy_behavior()
-
-from RL_agent import RL_agent
-from Global_parameters import gp
-
-rl_agent = RL_agent()
-
-def get_eval_metrics():
-  rl_agent.evaluator.run()
-  results = {}
-  for metric in rl_agent.evaluator.metrics:
-    results[metric.name] = metric.result()
-  return results
-
-def log_eval_metrics(step, metrics):
-    eval_results = (', ').join(
-      '{} = {:.6f}'.format(name, result) for name, result in metrics.items())
-    print('step = {0}: {1}'.format(step, eval_results))
-    print('eval_step = {0}: eval_handovers = {1}: eval_av_return = {2}: eval_reward = {3}: eval_action = {4}'.format(step,
-                gp.eval_handovers_count, metrics["AverageReturn"], gp.eval_reward_, gp.eval_action__))
-    myoutput = open(gp.file_name, 'a')
-    subprocess.run(["echo", 'eval_step = {0}: eval_results = {1}: eval_handovers = {2}: eval_av_return = {3}: eval_reward = {4}: eval_action = {5}:eval_total_throughputs = {6}: eval_total_rsrqs = {7}: eval_cell_throughputs = {8}: eval_cell_rsrqss = {9}\n'.format(step,
-      eval_results, gp.eval_handovers_count, metrics["AverageReturn"], gp.eval_reward_, gp.eval_action__, gp.eval_throughput_to_save, gp.eval_rsrq_to_save, gp.eval_cell_throughputs, gp.eval_cell_rsrqs)], stdout=myoutput)
-    
-
-def get_eval2_metrics():
-  rl_agent.evaluator2.run()
-  results = {}
-  for metric in rl_agent.evaluator2.metrics:
-    results[metric.name] = metric.result()
-  return results
-
-def log_eval2_metrics(step, metrics):
-    eval2_results = (', ').join(
-      '{} = {:.6f}'.format(name, result) for name, result in metrics.items())
-    print('step = {0}: {1}'.format(step, eval2_results))
-    print('eval2_step = {0}: eval2_handovers = {1}: eval2_av_return = {2}: eval2_reward = {3}: eval2_action = {4}'.format(step,
-                gp.eval2_handovers_count, metrics["AverageReturn"], gp.eval2_reward_, gp.eval2_action__))
-    myoutput = open(gp.file_name, 'a')
-    # print('CALL ENV')
-    subprocess.run(["echo", 'eval2_step = {0}: eval2_results = {1}: eval2_handovers = {2}: eval2_av_return = {3}: eval2_reward = {4}: eval2_action = {5}: eval2_total_throughputs = {6}: eval2_total_rsrqs = {7}: eval2_cell_throughputs = {8}: eval2_cell_rsrqss = {9}\n'.format(step,
-      eval2_results, gp.eval2_handovers_count, metrics["AverageReturn"], gp.eval2_reward_, gp.eval2_action__, gp.eval2_throughput_to_save, gp.eval2_rsrq_to_save, gp.eval2_cell_throughputs, gp.eval2_cell_rsrqs)], stdout=myoutput)
-    
-rl_agent.tf_agent.train_step_counter.assign(0)
-steps = []
-loss = []
-handovers = []
-rewards = []
-av_return = []
-av_return2 = []
-
-metrics = get_eval_metrics()
-avg_return = get_eval_metrics()["AverageReturn"]
-returns = [avg_return]
-
-metrics2 = get_eval2_metrics()
-avg_return2 = get_eval2_metrics()["AverageReturn"]
-returns2 = [avg_return2]
-
-for _ in range(gp.num_iterations):
-    # Training.
-    rl_agent.collector.run()
-    loss_info = rl_agent.agent_learner.run(iterations=1)
-
-    step = rl_agent.agent_learner.train_step_numpy
-
-    if gp.eval_interval and step % gp.eval_interval == 0:
-        metrics = get_eval_metrics()
-        log_eval_metrics(step, metrics)
-        returns.append(metrics["AverageReturn"])
-
-    if gp.eval2_interval and step % gp.eval2_interval == 0:
-        metrics2 = get_eval2_metrics()
-        log_eval2_metrics(step, metrics2)
-        returns2.append(metrics2["AverageReturn"])
-
-    if gp.log_interval and step % gp.log_interval == 0:
-        print(gp.handovers_count, gp.throughput_to_save)
-        steps.append(step)
-        loss.append(loss_info.loss.numpy())
-        handovers.append(gp.handovers_count)
-        av_return.append(metrics["AverageReturn"])
-        av_return2.append(metrics2["AverageReturn"])
-        rewards.append(gp.reward_)
-        print('step = {0}: loss = {1}: handovers = {2}: av_return = {3}: reward = {4}: action = {5}'.format(step, loss_info.loss.numpy(), gp.handovers_count, metrics["AverageReturn"], gp.reward_, gp.action__))
-        myoutput = open(gp.file_name, 'a')
-        # print('CALL ENV')
-        subprocess.run(["echo", 'step = {0}: loss = {1}: handovers = {2}: av_return = {3}: av_return2 = {4}: reward = {5}: action = {6}: total_throughputs = {7}: total_rsrqs = {8}: cell_throughputs = {9}: cell_rsrqs = {10}: max_speed = {11}: min_speed = {12}: duration = {13}: count = {14}\n'.format(step, loss_info.loss.numpy(), gp.handovers_count, metrics["AverageReturn"], metrics2["AverageReturn"], gp.reward_, gp.action__, gp.throughput_to_save, gp.rsrq_to_save, gp.cell_throughputs, gp.cell_rsrqs, gp.max_speed, gp.min_speed, gp.duration, gp.ues)], stdout=myoutput)
-
-
-rl_agent.rb_observer.close()
-rl_agent.reverb_server.stop()
\ No newline at end of file
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import time
+import numpy as np
+
+from Global_parameters import gp
+from Evaluation_service import EvaluationService
+from Metrics_sink import get_sink, close_sinks
+from Run_state import RingBuffer
+from Stage_profiler import profiler, export_tensorboard
+
+def get_eval_metrics():
+  if rl_agent.eval_snapshot is not None:
+    rl_agent.eval_snapshot.update()
+  with profiler.stage('evaluation'):
+    return rl_agent.evaluation_suite.run()
+
+def log_eval_metrics(step, metrics):
+    # One line per scenario, then the aggregate over all of them
+    for name, scenario in metrics['scenarios'].items():
+        print('eval_step = {0}: scenario = {1}: eval_handovers = {2}: eval_reward = {3}: eval_action = {4}'.format(step,
+                name, scenario['handovers'], scenario['return'], scenario['action']))
+    print('eval_step = {0}: eval_av_return = {1}: eval_min_return = {2}: eval_max_return = {3}: eval_av_handovers = {4}'.format(step,
+                metrics['AverageReturn'], metrics['MinReturn'], metrics['MaxReturn'], metrics['AverageHandovers']))
+    log_sink.write({'record': 'eval', 'eval_step': step,
+      'eval_results': {name: value for name, value in metrics.items() if name != 'scenarios'},
+      'eval_av_return': metrics['AverageReturn'], 'eval_scenarios': metrics['scenarios']})
+
+def handle_evaluations(finished):
+    global metrics
+    # Results are logged with the train step the policy snapshot was taken at
+    for name, eval_step, results in finished:
+        metrics = results
+        log_eval_metrics(eval_step, metrics)
+        returns.append(metrics["AverageReturn"])
+
+# The evaluation workers import this module as __mp_main__, so TensorFlow and
+# the training only start when it is run
+if __name__ == '__main__':
+    import tensorflow as tf
+
+    from tensorflow.python.ops.numpy_ops import np_config
+    np_config.enable_numpy_behavior()
+
+    from RL_agent import RL_agent, checkingdir
+
+    rl_agent = RL_agent()
+    log_sink = get_sink(gp.file_name, gp.metrics_flush_interval)
+    if profiler.enabled:
+        stats_sink = get_sink(gp.profile_stats_file, 1)
+        stats_writer = tf.summary.create_file_writer(os.path.join(checkingdir, 'stages'))
+
+    # A resumed run carries on from the restored train step
+    if not rl_agent.resumed:
+        rl_agent.tf_agent.train_step_counter.assign(0)
+    # Recent history only, so memory stays flat over long runs
+    steps = RingBuffer(gp.run_state_capacity, dtype=np.int64)
+    loss = RingBuffer(gp.run_state_capacity)
+    handovers = RingBuffer(gp.run_state_capacity, dtype=np.int64)
+    rewards = RingBuffer(gp.run_state_capacity)
+    av_return = RingBuffer(gp.run_state_capacity)
+
+    metrics = get_eval_metrics()
+    avg_return = metrics["AverageReturn"]
+    returns = RingBuffer(gp.run_state_capacity)
+    returns.append(avg_return)
+
+    evaluation_service = None
+    if gp.async_evaluation:
+        evaluation_service = EvaluationService()
+        evaluation_service.add('eval', rl_agent.evaluation_suite, rl_agent.eval_snapshot)
+
+    # End to end training speed between two train log records, simulator
+    # (or replay backend), collector, learner and evaluators included
+    log_time = time.perf_counter()
+    log_step = rl_agent.agent_learner.train_step_numpy
+
+    while rl_agent.agent_learner.train_step_numpy < gp.num_iterations:
+        # Training.
+        if rl_agent.fidelity is not None:
+            rl_agent.fidelity.advance(rl_agent.agent_learner.train_step_numpy)
+        if rl_agent.pipeline is not None:
+            # The next episode simulates during the learner step; 'collect' is
+            # the time the learner then still waits for it
+            rl_agent.pipeline.start(rl_agent.agent_learner.train_step_numpy)
+            with profiler.stage('learner'):
+                loss_info = rl_agent.agent_learner.run(iterations=1)
+            with profiler.stage('collect'):
+                rl_agent.pipeline.wait()
+        else:
+            with profiler.stage('collect'):
+                rl_agent.collector.run()
+            with profiler.stage('learner'):
+                loss_info = rl_agent.agent_learner.run(iterations=1)
+
+        step = rl_agent.agent_learner.train_step_numpy
+
+        if profiler.enabled and step % gp.profile_report_interval == 0:
+            stage_stats = profiler.report()
+            stats_sink.write(dict(step=step, **stage_stats))
+            export_tensorboard(stage_stats, step, stats_writer)
+
+        if gp.checkpoint_interval and step % gp.checkpoint_interval == 0:
+            with profiler.stage('checkpoint'):
+                rl_agent.checkpointer.save(step)
+
+        if evaluation_service is not None:
+            if gp.eval_interval and step % gp.eval_interval == 0:
+                evaluation_service.submit('eval', step)
+            handle_evaluations(evaluation_service.poll())
+        else:
+            if gp.eval_interval and step % gp.eval_interval == 0:
+                metrics = get_eval_metrics()
+                log_eval_metrics(step, metrics)
+                returns.append(metrics["AverageReturn"])
+
+        if gp.log_interval and step % gp.log_interval == 0:
+            # The last episode of the first collect worker, plus the recent means
+            # of every worker
+            episode = rl_agent.collect_env.metrics.latest
+            print(episode['handovers_count'], episode['throughput_to_save'])
+            steps.append(step)
+            loss.append(loss_info.loss.numpy())
+            handovers.append(episode['handovers_count'])
+            av_return.append(metrics["AverageReturn"])
+            rewards.append(episode['reward'])
+            now = time.perf_counter()
+            steps_per_sec = (step - log_step) / (now - log_time)
+            log_time, log_step = now, step
+            print('step = {0}: loss = {1}: handovers = {2}: av_return = {3}: reward = {4}: action = {5}: steps/s = {6:.3f}'.format(step, loss_info.loss.numpy(), episode['handovers_count'], metrics["AverageReturn"], episode['reward'], episode['action'], steps_per_sec))
+            log_sink.write({'record': 'train', 'step': step, 'steps_per_sec': steps_per_sec, 'loss': loss_info.loss.numpy(), 'handovers': episode['handovers_count'],
+              'av_return': metrics["AverageReturn"], 'reward': episode['reward'], 'action': episode['action'],
+              'total_throughputs': episode['throughput_to_save'], 'total_rsrqs': episode['rsrq_to_save'], 'cell_throughputs': episode['cell_throughputs'],
+              'cell_rsrqs': episode['cell_rsrqs'], 'max_speed': episode['max_speed'], 'min_speed': episode['min_speed'], 'duration': episode['duration'],
+              'count': episode['UE_Count'], 'workers': [env.metrics.summary() for env in rl_agent.collect_envs],
+              'surrogate': rl_agent.surrogate.summary() if rl_agent.surrogate is not None else None,
+              'fidelity': rl_agent.fidelity.summary() if rl_agent.fidelity is not None else None,
+              'scenarios': rl_agent.scenarios.summary() if rl_agent.scenarios is not None else None})
+
+
+    if rl_agent.pipeline is not None:
+        rl_agent.pipeline.close()
+    if evaluation_service is not None:
+        handle_evaluations(evaluation_service.close())
+    rl_agent.evaluation_suite.close()
+
+    if gp.checkpoint_interval:
+        rl_agent.checkpointer.save(rl_agent.agent_learner.train_step_numpy, wait=True)
+    rl_agent.checkpointer.close()
+
+    close_sinks()
+
+    for env in rl_agent.collect_envs:
+        env.close()
+    for observer in rl_agent.observers:
+        observer.close()
+    rl_agent.reverb_server.stop()